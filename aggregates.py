@@ -0,0 +1,168 @@
+import sys
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+
+MS_PER_DAY = 86_400_000
+EPOCH_DAY_ORDINAL = date(1970, 1, 1).toordinal()
+
+def day_of(epoch_ms):
+    """Returns the UTC day number (days since 1970-01-01) of an epoch-millisecond time."""
+    return epoch_ms // MS_PER_DAY
+
+def day_of_date(value):
+    """Returns the day number of a calendar date."""
+    return value.toordinal() - EPOCH_DAY_ORDINAL
+
+# --- Daily Rollups ---
+class DailyRollups:
+    """Points per UTC day, per (event ID, event type) and per user.
+
+    Records are bucketed by the day they started on, so a leaderboard over a
+    window only sums the buckets of the days inside it, however many records
+    those days hold.
+    """
+
+    def __init__(self):
+        # day -> (event_id, event_type) -> user_id -> points
+        self._days = {}
+        # Sorted day numbers, for range lookups.
+        self._day_list = []
+
+    def add(self, record):
+        self.add_points(day_of(record.start_ms), record.event_id, record.event_type or 'Unknown', record.user_id, record.points_earned)
+
+    def add_points(self, day, event_id, event_type, user_id, points):
+        groups = self._days.get(day)
+        if groups is None:
+            groups = self._days[day] = {}
+            insort(self._day_list, day)
+        users = groups.setdefault((event_id, event_type), {})
+        users[user_id] = users.get(user_id, 0.0) + points
+
+    def clear(self):
+        self._days.clear()
+        self._day_list = []
+
+    def totals(self, first_day=None, last_day=None, event_id=None, event_type=None):
+        """Sums points per user over an inclusive day range, optionally for one event ID or type."""
+        low = 0 if first_day is None else bisect_left(self._day_list, first_day)
+        high = len(self._day_list) if last_day is None else bisect_right(self._day_list, last_day)
+        totals = {}
+        for day in self._day_list[low:high]:
+            for (group_event_id, group_event_type), users in self._days[day].items():
+                if event_id is not None and group_event_id != event_id:
+                    continue
+                if event_type is not None and group_event_type != event_type:
+                    continue
+                for user_id, points in users.items():
+                    totals[user_id] = totals.get(user_id, 0.0) + points
+        return totals
+
+    def top(self, limit, **window):
+        """Returns the leading (user_id, points) pairs of a window, ordered like PointsIndex.top."""
+        ranked = heapq.nsmallest(limit, ((-points, user_id) for user_id, points in self.totals(**window).items()))
+        return [(user_id, -neg_points) for neg_points, user_id in ranked]
+
+    def __len__(self):
+        return len(self._day_list)
+
+def summarize_records(records):
+    """Returns the JSON-ready per-user, per-type and per-day point totals of a batch of records.
+
+    `PointsIndex.rebuild` folds these in as if it had seen the records.
+    """
+    users = {}
+    types = {}
+    daily = {}
+    for record in records:
+        count, points = users.get(record.user_id, (0, 0.0))
+        users[record.user_id] = (count + 1, points + record.points_earned)
+        event_type = record.event_type or 'Unknown'
+        types[event_type] = types.get(event_type, 0.0) + record.points_earned
+        key = (day_of(record.start_ms), record.event_id, event_type, record.user_id)
+        daily[key] = daily.get(key, 0.0) + record.points_earned
+    return {
+        'users': {user_id: list(totals) for user_id, totals in users.items()},
+        'types': types,
+        'daily': [[*key, points] for key, points in daily.items()],
+    }
+
+# --- Points Index ---
+class PointsIndex:
+    """Running per-user and per-event-type point totals with a sorted leaderboard.
+
+    Records are folded in one at a time as they are finalized, so totals and
+    rankings never require a scan over the record history. `daily` holds the
+    same points bucketed by day for windowed leaderboards.
+    """
+
+    def __init__(self):
+        self.user_points = {}
+        self.user_counts = {}
+        self.type_points = {}
+        self.daily = DailyRollups()
+        # Sorted ascending by (-points, user_id), so the leader is first.
+        self._ranking = []
+
+    def add(self, record):
+        """Folds a single finalized record into the totals."""
+        user_id = record.user_id
+        points = record.points_earned
+        old_points = self.user_points.get(user_id)
+        new_points = (old_points or 0.0) + points
+
+        if old_points is not None:
+            del self._ranking[bisect_left(self._ranking, (-old_points, user_id))]
+        insort(self._ranking, (-new_points, user_id))
+
+        self.user_points[user_id] = new_points
+        self.user_counts[user_id] = self.user_counts.get(user_id, 0) + 1
+        event_type = record.event_type or 'Unknown'
+        self.type_points[event_type] = self.type_points.get(event_type, 0.0) + points
+        self.daily.add(record)
+
+    def rebuild(self, records, summaries=()):
+        """Recomputes every total from an iterable of records plus the `summarize_records` output of archived ones."""
+        self.clear()
+        for record in records:
+            user_id = record.user_id
+            points = record.points_earned
+            self.user_points[user_id] = self.user_points.get(user_id, 0.0) + points
+            self.user_counts[user_id] = self.user_counts.get(user_id, 0) + 1
+            event_type = record.event_type or 'Unknown'
+            self.type_points[event_type] = self.type_points.get(event_type, 0.0) + points
+            self.daily.add(record)
+        for summary in summaries:
+            # Interned like EventRecord fields, so lookups share one string object per ID.
+            for user_id, (count, points) in summary['users'].items():
+                user_id = sys.intern(user_id)
+                self.user_points[user_id] = self.user_points.get(user_id, 0.0) + points
+                self.user_counts[user_id] = self.user_counts.get(user_id, 0) + count
+            for event_type, points in summary.get('types', {}).items():
+                self.type_points[event_type] = self.type_points.get(event_type, 0.0) + points
+            for day, event_id, event_type, user_id, points in summary['daily']:
+                self.daily.add_points(day, sys.intern(event_id), sys.intern(event_type), sys.intern(user_id), points)
+                if 'types' not in summary:
+                    # Segments sealed while summaries briefly left out the type totals.
+                    self.type_points[event_type] = self.type_points.get(event_type, 0.0) + points
+        self._ranking = sorted((-points, user_id) for user_id, points in self.user_points.items())
+
+    def clear(self):
+        self.user_points.clear()
+        self.user_counts.clear()
+        self.type_points.clear()
+        self.daily.clear()
+        self._ranking = []
+
+    def user_totals(self, user_id):
+        """Returns (record count, total points) for a user."""
+        user_id = str(user_id)
+        return self.user_counts.get(user_id, 0), self.user_points.get(user_id, 0.0)
+
+    def top(self, limit):
+        """Returns the leading (user_id, total points) pairs, highest first."""
+        return [(user_id, -neg_points) for neg_points, user_id in self._ranking[:limit]]
+
+    def __len__(self):
+        return len(self.user_points)
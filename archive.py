@@ -0,0 +1,240 @@
+import os
+import re
+import csv
+import sys
+import json
+import fcntl
+import logging
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from storage import EventRecord, create_store, guild_data_dir
+from aggregates import MS_PER_DAY, day_of_date
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+CSV_FIELDS = ('user_id', 'event_id', 'event_type', 'start_time', 'end_time', 'duration_minutes', 'points_earned')
+CHUNK_SIZE = 1000
+READ_SIZE = 1 << 16
+
+def chunked(iterable, size=CHUNK_SIZE):
+    """Groups an iterable into lists of at most `size` items."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- Export ---
+def write_records(records, file_path, fmt='csv'):
+    """Streams records into a CSV or JSON Lines file one chunk at a time and returns how many were written.
+
+    Only one chunk of records is held at once; a failed export removes its partial file.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}.")
+    count = 0
+    try:
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                writer.writeheader()
+                for chunk in chunked(records):
+                    writer.writerows(record.to_dict() for record in chunk)
+                    count += len(chunk)
+            else:
+                for chunk in chunked(records):
+                    f.write(''.join(json.dumps(record.to_dict(), ensure_ascii=False) + '\n' for record in chunk))
+                    count += len(chunk)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return count
+
+# --- Import ---
+_SEPARATORS = re.compile(r'[\s,]*')
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """Yields the elements of a JSON array file without reading the whole file into memory."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array of records.")
+    pos = 1
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError("Need more data", buffer, pos)
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("The JSON array is truncated or malformed.")
+            more = f.read(read_size)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        yield value
+
+def iter_archive_records(file_path):
+    """Yields EventRecords from a JSON array (e.g. a reset backup), JSON Lines or CSV file.
+
+    The format is chosen by extension, and files are read incrementally.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    with open(file_path, 'r', newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            for row in csv.DictReader(f):
+                row['duration_minutes'] = float(row['duration_minutes'] or 0)
+                row['points_earned'] = float(row['points_earned'] or 0)
+                row['event_type'] = row.get('event_type') or None
+                yield EventRecord.from_dict(row)
+        elif extension == '.jsonl':
+            for line in f:
+                if line.strip():
+                    yield EventRecord.from_dict(json.loads(line))
+        else:
+            for data in iter_json_array(f):
+                yield EventRecord.from_dict(data)
+
+def read_batches(file_path, size=CHUNK_SIZE):
+    """Yields the records of an archive file in lists of at most `size`, ready for `store.add_records`."""
+    return chunked(iter_archive_records(file_path), size)
+
+def record_key(record):
+    return hash((record.user_id, record.event_id, record.start_ms))
+
+class RecordKeys:
+    """Sorted hashes of (user_id, event_id, start time) identifying records, eight bytes each.
+
+    A user joins an event once per start time, so a record whose key is
+    present is already in the history. Hash collisions could only make an
+    import skip a record, never add one twice.
+    """
+
+    def __init__(self, records):
+        self.hashes = array('q', sorted(record_key(record) for record in records))
+
+    def __contains__(self, record):
+        key = record_key(record)
+        i = bisect_left(self.hashes, key)
+        return i < len(self.hashes) and self.hashes[i] == key
+
+    def __len__(self):
+        return len(self.hashes)
+
+def stored_keys(store, file_path):
+    """Returns the RecordKeys of the stored records in the archive's time range.
+
+    Reads the archive once for its range and the store only within it, so
+    this runs off the event loop.
+    """
+    start_ms = end_ms = None
+    for record in iter_archive_records(file_path):
+        start_ms = record.start_ms if start_ms is None else min(start_ms, record.start_ms)
+        end_ms = record.start_ms + 1 if end_ms is None else max(end_ms, record.start_ms + 1)
+    if start_ms is None:
+        return RecordKeys(())
+    return RecordKeys(store.iter_records(start_ms=start_ms, end_ms=end_ms))
+
+def import_records(store, file_path):
+    """Appends the records of an archive file the store doesn't hold yet, one batch per mutation.
+
+    Returns (imported, skipped), where skipped counts the records already in
+    the history, e.g. when the same file is imported twice.
+    """
+    known = stored_keys(store, file_path)
+    imported = skipped = 0
+    for batch in read_batches(file_path):
+        new_records = [record for record in batch if record not in known]
+        skipped += len(batch) - len(new_records)
+        if new_records:
+            store.add_records(new_records)
+        imported += len(new_records)
+    return imported, skipped
+
+# --- Command Line ---
+def date_range_ms(start_date=None, end_date=None):
+    """Turns inclusive YYYY-MM-DD (UTC) dates into a start-time range in epoch milliseconds, end exclusive."""
+    start_ms = end_ms = None
+    if start_date:
+        start_ms = day_of_date(datetime.strptime(start_date, '%Y-%m-%d').date()) * MS_PER_DAY
+    if end_date:
+        end_ms = (day_of_date(datetime.strptime(end_date, '%Y-%m-%d').date()) + 1) * MS_PER_DAY
+    return start_ms, end_ms
+
+def lock_data_dir(data_dir):
+    """Takes the bot's instance lock so the CLI never writes data a running bot owns.
+
+    Returns the locked file descriptor, or None if the bot is running.
+    """
+    lock_fd = os.open(os.path.join(data_dir, 'bot.pid'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(lock_fd)
+        return None
+    return lock_fd
+
+def main():
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+    parser = argparse.ArgumentParser(description="Export or import event records.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--guild", type=int, help="Guild ID whose records to use. Without it, the files directly in --data-dir are used.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Stream records into a CSV or JSON Lines file.")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("--output", help="Defaults to event_records_export_<timestamp>.<format>.")
+    export_parser.add_argument("--start-date", help="First day to include, YYYY-MM-DD (UTC).")
+    export_parser.add_argument("--end-date", help="Last day to include, YYYY-MM-DD (UTC).")
+    export_parser.add_argument("--user", help="Only export this user ID.")
+    export_parser.add_argument("--event-id")
+    export_parser.add_argument("--event-type")
+    import_parser = subparsers.add_parser("import", help="Append the records of a backup or export file that are not in the history yet.")
+    import_parser.add_argument("file", help="A JSON array (e.g. event_records_backup_*.json), .jsonl or .csv file.")
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+        start_ms, end_ms = date_range_ms(getattr(args, 'start_date', None), getattr(args, 'end_date', None))
+    except (OSError, ValueError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    if lock_data_dir(args.data_dir) is None:
+        logging.error("The bot is running on this data directory. Stop it first, or use /event export.")
+        sys.exit(1)
+
+    storage_config = config.get('storage', {})
+    store_dir = args.data_dir if args.guild is None else guild_data_dir(args.data_dir, args.guild, storage_config)
+    os.makedirs(store_dir, exist_ok=True)
+    store = create_store(storage_config, store_dir)
+    store.load()
+    store.load_history()
+    try:
+        if args.command == "export":
+            output = args.output or f"event_records_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+            records = store.iter_records(args.user, args.event_id, args.event_type, start_ms, end_ms)
+            count = write_records(records, output, args.format)
+            logging.info(f"Exported {count} records to {output}.")
+        elif args.command == "import":
+            count, skipped = import_records(store, args.file)
+            store.compact(wait=True)
+            logging.info(f"Imported {count} records from {args.file}, skipped {skipped} already in the history.")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
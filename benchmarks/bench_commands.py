@@ -0,0 +1,375 @@
+"""Benchmarks for the /event slash commands.
+
+Drives the real command callbacks from bot.py through the fake interaction
+harness, so no Discord connection is needed. A synthetic dataset of active
+events and historical records is generated into a temporary data directory
+before bot.py is imported, which also makes startup (load plus replay) part
+of the measurement.
+
+Examples:
+    python3 benchmarks/bench_commands.py
+    python3 benchmarks/bench_commands.py --records 1000000 --participants 10000
+    python3 benchmarks/bench_commands.py --backend sqlite --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from harness import FakeGuild, FakeInteraction, FakeMember, FakeVoiceChannel, FakeVoiceState  # noqa: E402
+from storage import EventRecord, create_store, epoch_ms_to_iso, guild_data_dir, migrate_json_to_sqlite, now_ms, write_records_json  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# ID ranges keep the synthetic populations apart.
+HISTORY_USER_BASE = 100_000_000_000_000_000
+PARTICIPANT_BASE = 200_000_000_000_000_000
+HOST_BASE = 300_000_000_000_000_000
+NEW_USER_BASE = 400_000_000_000_000_000
+# The synthetic dataset belongs to this guild.
+GUILD_ID = 1
+VOICE_CHANNEL_ID = 500
+VOICE_MEMBERS = 300
+
+# --- Dataset Generation ---
+def synthetic_records(count, users, event_configs):
+    """Yields `count` records spread over `users` users, oldest first, one minute apart."""
+    configs = list(event_configs.values())
+    first_start = now_ms() - count * 60_000
+    for i in range(count):
+        config = configs[i % len(configs)]
+        duration_minutes = float(30 + i % 90)
+        start_ms = first_start + i * 60_000
+        yield EventRecord(
+            user_id=str(HISTORY_USER_BASE + i % users),
+            event_id=str(config['event_id']),
+            event_type=config['event_type'],
+            start_ms=start_ms,
+            end_ms=start_ms + int(duration_minutes * 60_000),
+            duration_minutes=duration_minutes,
+            points_earned=round(duration_minutes * config['points_per_minute'], 2),
+        )
+
+def synthetic_active_events(events, participants, event_id):
+    """Builds `events` running events sharing `participants` participants between them."""
+    started = now_ms() - 3_600_000
+    per_event = max(1, participants // events)
+    active = {}
+    for e in range(events):
+        host_id = str(HOST_BASE + e)
+        members = {host_id: {'join_time': started}}
+        for p in range(per_event):
+            members[str(PARTICIPANT_BASE + e * per_event + p)] = {'join_time': started + p * 1000}
+        active[f"b{e:03d}"] = {'creator_id': host_id, 'event_id': event_id, 'start_time': started, 'participants': members}
+    return active
+
+def prepare_workspace(args):
+    """Creates a temporary bot working directory holding the config and the synthetic dataset."""
+    workspace = tempfile.mkdtemp(prefix='sfl-bench-')
+    with open(os.path.join(REPO_DIR, 'config.json')) as f:
+        config = json.load(f)
+    config.setdefault('storage', {})['backend'] = args.backend
+    config.setdefault('metrics', {})['enabled'] = args.metrics
+    with open(os.path.join(workspace, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    event_configs = {str(event['event_id']): event for event in config['events']}
+    data_dir = guild_data_dir(os.path.join(workspace, 'data'), GUILD_ID, config['storage'])
+    os.makedirs(data_dir)
+    write_records_json(os.path.join(data_dir, 'event_records.json'), synthetic_records(args.records, args.users, event_configs))
+
+    active = synthetic_active_events(args.events, args.participants, next(iter(event_configs)))
+    for event in active.values():
+        event['start_time'] = epoch_ms_to_iso(event['start_time'])
+        for participant in event['participants'].values():
+            participant['join_time'] = epoch_ms_to_iso(participant['join_time'])
+    with open(os.path.join(data_dir, 'active_events.json'), 'w') as f:
+        json.dump(active, f)
+
+    if args.backend == 'sqlite':
+        migrate_json_to_sqlite(data_dir, os.path.join(data_dir, config['storage'].get('sqlite_file', 'events.db')))
+    else:
+        # Seal past months into segments, as a bot running through them would have.
+        store = create_store(config['storage'], data_dir)
+        store.load()
+        store.load_history()
+        store.compact(wait=True)
+        store.close()
+    return workspace
+
+# --- Measurement ---
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def measure(name, prepare, iterations, memory_iterations):
+    """Times `iterations` calls of the coroutine returned by `prepare()`, then samples peak memory.
+
+    `prepare` runs outside the timed region, so per-call setup such as
+    creating a fresh event to stop is not counted.
+    """
+    latencies = []
+    for _ in range(iterations):
+        call = prepare()
+        started = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - started)
+
+    # The median per-call peak is reported alongside the maximum, since an
+    # occasional journal compaction inflates whichever call triggers it.
+    peaks = []
+    tracemalloc.start()
+    for _ in range(memory_iterations):
+        call = prepare()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return name, {
+        'iterations': iterations,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'throughput_per_s': iterations / total if total else float('inf'),
+        'peak_kib': statistics.median(peaks) / 1024 if peaks else 0.0,
+        'max_peak_kib': max(peaks) / 1024 if peaks else 0.0,
+    }
+
+async def run_commands(bot, args):
+    """Runs every command scenario and returns {scenario: stats}."""
+    history_members = [FakeMember(HISTORY_USER_BASE + i) for i in range(args.users)]
+    guild = FakeGuild(GUILD_ID, cached_members=history_members)
+    state = bot.guild_states[GUILD_ID]
+    for event in state.active_events.events.values():
+        for user_id in event['participants']:
+            guild.add_member(FakeMember(int(user_id)))
+
+    counter = iter(range(10**9))
+    event_ids = list(bot.event_catalog)
+    stop_type = bot.event_catalog.get(event_ids[-1])
+    busiest_code = max(state.active_events, key=lambda code: len(state.active_events[code]['participants']))
+    busiest_host = FakeMember(int(state.active_events[busiest_code]['creator_id']))
+    history_user = history_members[0]
+    iterations = args.iterations
+    memory_iterations = min(iterations, args.memory_iterations)
+    results = {}
+
+    def new_member():
+        member = FakeMember(NEW_USER_BASE + next(counter), guild=guild)
+        guild.add_member(member)
+        return member
+
+    def prepare_start():
+        host = new_member()
+        return lambda: bot.start.callback(FakeInteraction(host, guild), event_ids[0])
+
+    def prepare_join():
+        member = new_member()
+        return lambda: bot.join.callback(FakeInteraction(member, guild), busiest_code)
+
+    def prepare_kick():
+        member = new_member()
+        state.store.join_event(busiest_code, str(member.id), {'join_time': now_ms()})
+        return lambda: bot.kick.callback(FakeInteraction(busiest_host, guild), member)
+
+    def prepare_stop():
+        host = new_member()
+        code = f"s{next(counter):07d}"
+        participants = {str(host.id): {'join_time': now_ms() - 3_600_000}}
+        for _ in range(args.stop_size - 1):
+            participants[str(new_member().id)] = {'join_time': now_ms() - 1_800_000}
+        state.store.start_event(code, {
+            'creator_id': str(host.id), 'event_id': stop_type.event_id, 'event_type': stop_type.event_type,
+            'points_per_minute': stop_type.points_per_minute, 'start_time': now_ms(), 'participants': participants,
+        })
+        return lambda: bot.stop.callback(FakeInteraction(host, guild))
+
+    def prepare_simple(command, member):
+        return lambda: (lambda: command.callback(FakeInteraction(member, guild)))
+
+    def prepare_uncached(prepare):
+        """Renders the response from scratch, as the first call after a data change does."""
+        def prepare_call():
+            state.responses.clear()
+            return prepare()
+        return prepare_call
+
+    def prepare_windowed_summary(**options):
+        return lambda: (lambda: bot.summary.callback(FakeInteraction(history_user, guild), **options))
+
+    async def open_records_pager():
+        interaction = FakeInteraction(history_user, guild)
+        await bot.records.callback(interaction)
+        return interaction.replies[-1][1]['view']
+
+    pager = await open_records_pager()
+
+    # A voice-linked event whose members keep dropping out and rejoining, as in a large fight.
+    voice_members = [new_member() for _ in range(VOICE_MEMBERS)]
+    voice_channel = FakeVoiceChannel(VOICE_CHANNEL_ID, voice_members)
+    await bot.start.callback(FakeInteraction(new_member(), guild), event_ids[0], voice_channel)
+    connected = {member.id for member in voice_members}
+
+    def prepare_voice_update():
+        member = voice_members[next(counter) % VOICE_MEMBERS]
+        before, after = (voice_channel, None) if member.id in connected else (None, voice_channel)
+        connected.symmetric_difference_update((member.id,))
+        return lambda: bot.on_voice_state_update(member, FakeVoiceState(before), FakeVoiceState(after))
+
+    def prepare_older_page():
+        async def click():
+            await pager.older_button.callback(FakeInteraction(history_user, guild))
+            if pager.older_button.disabled:
+                pager.page_no = 0
+                await pager.build_page(guild)
+        return click
+
+    scenarios = [
+        ('start', prepare_start),
+        ('join', prepare_join),
+        ('kick', prepare_kick),
+        ('stop', prepare_stop),
+        ('list', prepare_simple(bot.list_participants, busiest_host)),
+        ('me', prepare_simple(bot.me, history_user)),
+        ('summary', prepare_simple(bot.summary, history_user)),
+        ('summary:cold', prepare_uncached(prepare_simple(bot.summary, history_user))),
+        ('summary:30d', prepare_windowed_summary(period=bot.SUMMARY_PERIODS[1])),
+        ('summary:type', prepare_windowed_summary(event_type=bot.event_catalog.get(event_ids[0]).event_type)),
+        ('records', prepare_simple(bot.records, history_user)),
+        ('records:cold', prepare_uncached(prepare_simple(bot.records, history_user))),
+        ('records:older', prepare_older_page),
+        ('voice', prepare_voice_update),
+    ]
+    for name, prepare in scenarios:
+        if args.only and name not in args.only:
+            continue
+        scenario_iterations = max(1, iterations // 10) if name == 'stop' else iterations
+        _, results[name] = await measure(name, prepare, scenario_iterations, min(scenario_iterations, memory_iterations))
+
+    if not args.only or 'reset' in args.only:
+        # Reset wipes the dataset, so it runs once and last.
+        admin = FakeMember(HOST_BASE - 1)
+        _, results['reset'] = await measure('reset', prepare_simple(bot.reset, admin), 1, 0)
+    results['_rest_member_fetches'] = {'count': guild.rest_fetches}
+    return results
+
+# --- Reporting ---
+def print_table(startup_s, history_s, results):
+    print(f"\nstartup (importing bot.py: config, active events, journal replay): {startup_s * 1000:.1f} ms")
+    print(f"record history loaded (background load and index rebuild): {history_s * 1000:.1f} ms\n")
+    header = f"{'command':<15}{'iters':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'ops/s':>12}{'peak KiB':>11}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in results.items():
+        if name.startswith('_'):
+            continue
+        print(f"{name:<15}{stats['iterations']:>7}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+              f"{stats['max_ms']:>10.3f}{stats['throughput_per_s']:>12.1f}{stats['peak_kib']:>11.1f}")
+    print(f"\nREST member fetches during run: {results['_rest_member_fetches']['count']}")
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns a list of human-readable regressions against a stored baseline report."""
+    if baseline.get('dataset') != report['dataset']:
+        print("\nBaseline was recorded with a different dataset; skipping comparison.")
+        return []
+    regressions = []
+    for name, stats in report['results'].items():
+        old = baseline['results'].get(name)
+        if name.startswith('_') or old is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'peak_kib'):
+            # Ignore sub-millisecond / sub-KiB noise on very cheap commands.
+            floor = 1.0
+            if stats[metric] > max(old[metric], floor) * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old[metric]:.3f} -> {stats[metric]:.3f}")
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+    else:
+        print(f"\nNo regressions against baseline (tolerance {tolerance:.0%}).")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /event commands without a Discord connection.")
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--metrics', action='store_true', help="Run with metrics collection enabled to measure its overhead.")
+    parser.add_argument('--records', type=int, default=100_000, help="Historical records to generate.")
+    parser.add_argument('--users', type=int, default=2_000, help="Distinct users in the history.")
+    parser.add_argument('--participants', type=int, default=10_000, help="Participants across all active events.")
+    parser.add_argument('--events', type=int, default=100, help="Active events.")
+    parser.add_argument('--stop-size', type=int, default=300, help="Participants in each event stopped by the stop benchmark.")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--memory-iterations', type=int, default=10, help="Extra iterations run under tracemalloc.")
+    parser.add_argument('--only', nargs='*', help="Only run these scenarios.")
+    parser.add_argument('--output', help="Write the JSON report here.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging a regression.")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--keep-workspace', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+    workspace = prepare_workspace(args)
+    os.chdir(workspace)
+    os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+
+    started = time.perf_counter()
+    import bot
+    startup_s = time.perf_counter() - started
+    bot.histories_ready.wait()
+    history_s = time.perf_counter() - started
+
+    try:
+        results = asyncio.run(run_commands(bot, args))
+    finally:
+        bot.close_stores()
+        if not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    dataset = {key: getattr(args, key) for key in ('backend', 'records', 'users', 'participants', 'events', 'stop_size', 'iterations')}
+    report = {
+        'dataset': dataset,
+        'python': platform.python_version(),
+        'startup_ms': startup_s * 1000,
+        'history_ms': history_s * 1000,
+        'results': results,
+    }
+    print_table(startup_s, history_s, results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
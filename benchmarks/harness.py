@@ -0,0 +1,100 @@
+"""Network-free stand-ins for the discord.py objects the /event commands touch."""
+import itertools
+
+import discord
+
+_interaction_ids = itertools.count(1)
+
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeMember:
+    """Quacks like discord.Member for everything bot.py reads."""
+
+    bot = False
+
+    def __init__(self, member_id, display_name=None, guild=None):
+        self.id = member_id
+        self.display_name = display_name or f"Member {member_id}"
+        self.name = self.display_name
+        self.color = discord.Colour.default()
+        self.display_avatar = FakeAvatar()
+        self.guild = guild
+
+class FakeGuild:
+    """Guild whose gateway member cache holds `cached_members`; everyone else costs a fake REST fetch."""
+
+    def __init__(self, guild_id=1, cached_members=()):
+        self.id = guild_id
+        self.filesize_limit = 10 * 1024 * 1024
+        self._members = {member.id: member for member in cached_members}
+        self.rest_fetches = 0
+
+    def add_member(self, member):
+        self._members[member.id] = member
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    async def fetch_member(self, member_id):
+        self.rest_fetches += 1
+        return FakeMember(member_id)
+
+class FakeVoiceChannel:
+    """Voice channel whose connected members are whatever the caller puts in `members`."""
+
+    def __init__(self, channel_id, members=()):
+        self.id = channel_id
+        self.members = list(members)
+        self.mention = f"<#{channel_id}>"
+
+class FakeVoiceState:
+    def __init__(self, channel=None):
+        self.channel = channel
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self._interaction.replies.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self._interaction.replies.append((None, kwargs))
+
+    def is_done(self):
+        return self._done
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        self._interaction.replies.append((content, kwargs))
+        return FakeMessage() if wait else None
+
+class FakeInteraction:
+    """Records every reply in `replies` instead of sending it to Discord."""
+
+    def __init__(self, user, guild):
+        self.id = next(_interaction_ids)
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.extras = {}
+        self.replies = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs):
+        self.replies.append((None, kwargs))
@@ -1,5 +1,13 @@
 import os
-import json
+import time
+
+# Taken first so restart-to-ready times include the imports below.
+STARTED_AT = time.perf_counter()
+
+import asyncio
+import functools
+from collections import OrderedDict
+from typing import Optional
 import logging
 import discord
 from discord.ext import commands
@@ -7,43 +15,18 @@ from discord import app_commands, Member, User, Interaction, Embed
 from dotenv import load_dotenv
 import random
 import string
-from datetime import datetime, timezone
+from datetime import datetime
 import atexit
-import psutil
-import time
 import sys
+import fcntl
 import signal
-import shutil
-# --- Instance Management ---
-def terminate_other_instances():
-    """Find and terminate other running instances of this script."""
-    current_pid = os.getpid()
-    my_name = os.path.basename(__file__)
-    logging.info(f"Instance manager started for {my_name} (PID: {current_pid}).")
-
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            # Check if process name contains python and script name is in command line
-            if 'python' in proc.info['name'].lower() and proc.info['cmdline'] and my_name in proc.info['cmdline'][-1]:
-                if proc.pid != current_pid:
-                    logging.warning(f"Found another running instance: PID {proc.pid}. Terminating it.")
-                    p = psutil.Process(proc.pid)
-                    p.terminate() # Send SIGTERM
-                    try:
-                        p.wait(timeout=3) # Wait for graceful shutdown
-                        logging.info(f"Instance {proc.pid} terminated gracefully.")
-                    except psutil.TimeoutExpired:
-                        logging.warning(f"Instance {proc.pid} did not terminate gracefully. Forcing kill.")
-                        p.kill() # Send SIGKILL
-                        logging.info(f"Instance {proc.pid} killed.")
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            continue
-        except Exception as e:
-            logging.error(f"Error while checking process {proc.pid}: {e}")
-
-# Run the terminator function at startup
-terminate_other_instances()
-
+import threading
+from storage import STORAGE_BACKENDS, create_store, guild_data_dir, stored_guild_ids, EventRecord, now_ms, write_records_json
+from aggregates import PointsIndex, MS_PER_DAY, day_of, day_of_date
+from archive import EXPORT_FORMATS, read_batches, stored_keys, write_records
+from metrics import metrics, start_http_server
+from catalog import ConfigWatcher, load_config
+from presence import PresenceTracker
 # --- Basic Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
 
@@ -56,67 +39,448 @@ if not DISCORD_TOKEN:
 
 # --- Constants ---
 CONFIG_FILE = 'config.json'
+CONFIG_POLL_INTERVAL_SECONDS = 5
 DATA_DIR = 'data'
-ACTIVE_EVENTS_FILE = os.path.join(DATA_DIR, 'active_events.json')
-EVENT_RECORDS_FILE = os.path.join(DATA_DIR, 'event_records.json')
+INSTANCE_LOCK_FILE = os.path.join(DATA_DIR, 'bot.pid')
+INSTANCE_HANDOFF_TIMEOUT_SECONDS = 3
+JOURNAL_COMPACT_THRESHOLD = 1000
+FLUSH_INTERVAL_MS = 250
+MEMBER_CACHE_TTL_SECONDS = 600
+MEMBER_CACHE_MAX_SIZE = 10000
+MEMBER_FETCH_CONCURRENCY = 5
+RESPONSE_CACHE_MAX_SIZE = 64
+RECORDS_PAGE_SIZE = 10
+RECORD_PAGER_TIMEOUT_SECONDS = 300
+PRESENCE_CHECKPOINT_SECONDS = 30
+RESET_BACKUP_ATTEMPTS = 3
+SUMMARY_PERIODS = [
+    app_commands.Choice(name="Last 7 days", value=7),
+    app_commands.Choice(name="Last 30 days", value=30),
+]
 
 # --- Ensure Data Directory Exists ---
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# --- Helper Functions for Data Persistence ---
-def save_data(file_path, data):
-    """Saves data to a JSON file with error handling."""
-    try:
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        logging.error(f"Could not write to file {file_path}: {e}")
-    except Exception as e:
-        logging.error(f"An unexpected error occurred while saving data to {file_path}: {e}")
-
-def load_data(file_path, default_data=None):
-    """Loads data from a JSON file, returning default data if not found or invalid."""
-    if default_data is None:
-        default_data = {}
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        save_data(file_path, default_data)
-        return default_data
+# --- Instance Management ---
+startup_timings = {}
+
+def acquire_instance_lock(lock_file):
+    """Takes the single-instance lock, shutting down the instance that holds it.
+
+    The lock is an flock on a file holding the owner's PID and is held until
+    this process exits, so finding the running instance costs one file read.
+    The old instance gets SIGTERM, which makes it flush its data, and is
+    killed if it still holds the lock after the handoff timeout.
+    """
+    lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        logging.warning(f"Could not load data from {file_path}, returning default. Reason: {e}")
-        return default_data
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        content = os.pread(lock_fd, 32, 0).decode(errors='ignore').strip()
+        pid = int(content) if content.isdigit() else None
+        logging.warning(f"Found another running instance: PID {pid}. Terminating it.")
+        try:
+            if pid is not None:
+                os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + INSTANCE_HANDOFF_TIMEOUT_SECONDS
+        while True:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                logging.info(f"Instance {pid} terminated gracefully.")
+                break
+            except BlockingIOError:
+                if time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    continue
+            logging.warning(f"Instance {pid} did not terminate gracefully. Forcing kill.")
+            try:
+                if pid is not None:
+                    os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            logging.info(f"Instance {pid} killed.")
+            break
+    os.ftruncate(lock_fd, 0)
+    os.pwrite(lock_fd, f"{os.getpid()}\n".encode(), 0)
+    return lock_fd
+
+# Take over from a running instance before loading its data, but not when imported (e.g. by the benchmarks)
+if __name__ == "__main__":
+    instance_lock = acquire_instance_lock(INSTANCE_LOCK_FILE)
+    startup_timings['lock'] = time.perf_counter() - STARTED_AT
 
 # --- Load Initial Data ---
 try:
-    with open(CONFIG_FILE, 'r') as f:
-        EVENT_CONFIGS = {str(event['event_id']): event for event in json.load(f)['events']}
-except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+    config, event_catalog = load_config(CONFIG_FILE)
+    STORAGE_CONFIG = config.get('storage', {})
+    METRICS_CONFIG = config.get('metrics', {})
+except (OSError, ValueError) as e:
     logging.error(f"FATAL: Could not load or parse {CONFIG_FILE}. Please ensure it exists and is valid. Error: {e}")
     exit()
 
-active_events = load_data(ACTIVE_EVENTS_FILE, {})
-event_records_data = load_data(EVENT_RECORDS_FILE, [])
+def build_event_id_embed(catalog):
+    """Renders the /event id list once per config load; returns None when no event types are configured."""
+    if not len(catalog):
+        return None
+    return Embed(title="Available Event IDs & Types", description=catalog.id_list, color=discord.Color.blue())
 
-def get_event_by_creator(creator_id):
-    """Finds an event hosted by a specific creator."""
-    global active_events
+event_id_embed = build_event_id_embed(event_catalog)
 
-    creator_id_str = str(creator_id)
-    for event_code, event in active_events.items():
-        if event.get('creator_id') == creator_id_str:
-            return event_code, event
-    return None, None
-    return None, None
+# --- Config Reloading ---
+def apply_config(new_config, catalog):
+    """Swaps in a changed config.json's event types; runs on the event loop, between handler steps.
 
-def calculate_and_finalize_points(member_id, event_code):
-    """Calculates points for a user, updates their record, and returns details."""
-    global active_events
-    global event_records_data
+    Running events keep the event type and rate they started with, see `start`.
+    """
+    global event_catalog, event_id_embed
+    for section, running in (('storage', STORAGE_CONFIG), ('metrics', METRICS_CONFIG)):
+        if new_config.get(section, {}) != running:
+            logging.warning(f"The {section} section of {CONFIG_FILE} differs from the running one; it takes effect after a restart.")
+    event_catalog, event_id_embed = catalog, build_event_id_embed(catalog)
+    logging.info(f"Reloaded {CONFIG_FILE}: {len(catalog)} event types.")
 
-    event = active_events.get(event_code)
-    if not event:
+config_watcher = ConfigWatcher(CONFIG_FILE, apply_config, CONFIG_POLL_INTERVAL_SECONDS)
+
+# Enabled before loading so startup is measured too.
+metrics.enabled = bool(METRICS_CONFIG.get('enabled', False))
+
+STORAGE_BACKEND = STORAGE_CONFIG.get('backend', 'json')
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    logging.error(f"FATAL: Unknown storage backend '{STORAGE_BACKEND}'. Check the storage section of {CONFIG_FILE}.")
+    exit()
+
+# --- Event Concurrency ---
+class EventLocks:
+    """asyncio locks keyed by event code, created on first use and dropped once nobody holds or awaits them.
+
+    Handlers take an event's lock around the checks and mutations that must
+    not interleave with another handler's awaits, so events never wait on
+    each other and an idle event costs nothing.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    def hold(self, event_code):
+        """Returns an async context manager holding the lock of `event_code`."""
+        return _HeldEventLock(self._locks, event_code)
+
+class _HeldEventLock:
+    __slots__ = ('locks', 'event_code', 'entry')
+
+    def __init__(self, locks, event_code):
+        self.locks = locks
+        self.event_code = event_code
+
+    async def __aenter__(self):
+        entry = self.entry = self.locks.get(self.event_code)
+        if entry is None:
+            entry = self.entry = self.locks[self.event_code] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_entry()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self.entry[0].release()
+        self._release_entry()
+
+    def _release_entry(self):
+        self.entry[1] -= 1
+        if not self.entry[1]:
+            del self.locks[self.event_code]
+
+# --- Response Cache ---
+class ResponseCache:
+    """LRU cache of rendered responses that is emptied whenever the store's data changes.
+
+    Entries are keyed by the request (e.g. the leaderboard window) and served
+    until the next mutation bumps `store.data_generation`; voice presence
+    checkpoints leave it alone. They also expire
+    after `ttl_seconds`, since they contain member names that can change
+    without any mutation.
+    """
+
+    def __init__(self, store, ttl_seconds, max_size):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._generation = store.data_generation
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if self._generation != self.store.data_generation:
+            self._entries.clear()
+            self._generation = self.store.data_generation
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            metrics.inc('sfl_response_cache_lookups_total', result='miss')
+            return None
+        self._entries.move_to_end(key)
+        metrics.inc('sfl_response_cache_lookups_total', result='hit')
+        return entry[0]
+
+    def put(self, key, response):
+        """Stores a response rendered from the data as of the last `get`."""
+        if self._generation != self.store.data_generation:
+            # The data changed while it was being rendered (e.g. during a member name fetch).
+            return
+        self._entries[key] = (response, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+# --- Per-Guild State ---
+class GuildState:
+    """One guild's store, active events and leaderboard totals, persisted in its own data directory.
+
+    Each guild has its own journal (or database) and write-behind flusher,
+    so a busy guild's writes never queue behind another guild's.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.data_dir = guild_data_dir(DATA_DIR, guild_id, STORAGE_CONFIG)
+        self.exports_dir = os.path.join(self.data_dir, 'exports')
+        os.makedirs(self.exports_dir, exist_ok=True)
+        self.store = create_store(STORAGE_CONFIG, self.data_dir, JOURNAL_COMPACT_THRESHOLD, FLUSH_INTERVAL_MS)
+        self.active_events = self.store.active_events
+        self.event_locks = EventLocks()
+        self.presence = PresenceTracker()
+        self.points_index = PointsIndex()
+        self.responses = ResponseCache(self.store, MEMBER_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_SIZE)
+        self.history_ready = threading.Event()
+
+    def load_history(self):
+        try:
+            self.store.load_history()
+            self.points_index.rebuild(self.store.hot_records(), self.store.segment_summaries())
+        except Exception:
+            logging.exception(f"FATAL: Could not load the event record history of guild {self.guild_id}.")
+            close_stores()
+            os._exit(1)
+        self.history_ready.set()
+
+guild_states = {}
+
+def adopt_event_terms(state):
+    """Gives events saved before they kept their event type and rate the ones configured now.
+
+    The event is saved again with them, so snapshots and restarts keep these terms.
+    """
+    for event_code, event in list(state.active_events.items()):
+        if 'points_per_minute' in event:
+            continue
+        event_type = event_catalog.get(event['event_id'])
+        if event_type is None:
+            logging.warning(f"Event {event_code} of guild {state.guild_id} has unknown event ID {event['event_id']}; it will award no points.")
+            continue
+        event['event_type'] = event_type.event_type
+        event['points_per_minute'] = event_type.points_per_minute
+        state.store.start_event(event_code, event)
+
+def open_guild_state(guild_id):
+    """Loads a guild's active events; its history is loaded separately by `GuildState.load_history`."""
+    state = GuildState(guild_id)
+    state.store.load()
+    adopt_event_terms(state)
+    state.presence.load(state.active_events)
+    guild_states[guild_id] = state
+    return state
+
+def guild_state(interaction):
+    """Returns the state of the interaction's guild, creating it for a guild the bot has not seen yet."""
+    state = guild_states.get(interaction.guild_id)
+    if state is None:
+        # Guilds with data are opened at startup, so this one has no history to wait for.
+        state = open_guild_state(interaction.guild_id)
+        state.load_history()
+        logging.info(f"Created the data directory of guild {interaction.guild_id}.")
+    return state
+
+def close_stores():
+    checkpoint_presence()
+    for state in list(guild_states.values()):
+        state.store.close()
+
+for guild_id in stored_guild_ids(DATA_DIR, STORAGE_CONFIG):
+    open_guild_state(guild_id)
+atexit.register(close_stores)
+startup_timings['load'] = time.perf_counter() - STARTED_AT
+
+if not STORAGE_CONFIG.get('legacy_guild_id') and any(
+    os.path.exists(os.path.join(DATA_DIR, name)) for name in ('active_events.json', 'event_records.json', 'journal.log', STORAGE_CONFIG.get('sqlite_file', 'events.db'))
+):
+    logging.warning(f"Found data from before multi-guild support in {DATA_DIR}/. Set storage.legacy_guild_id in {CONFIG_FILE} to the guild it belongs to.")
+
+# --- Voice Presence ---
+def checkpoint_presence():
+    """Persists the presence changes of every voice-linked event as one mutation per event."""
+    now = now_ms()
+    for state in list(guild_states.values()):
+        for event_code, presence in state.presence.checkpoint(now).items():
+            state.store.record_presence(event_code, presence)
+
+presence_checkpoint_task = None
+
+async def checkpoint_presence_periodically():
+    while True:
+        await asyncio.sleep(PRESENCE_CHECKPOINT_SECONDS)
+        try:
+            checkpoint_presence()
+        except Exception:
+            logging.exception("Could not save voice presence.")
+
+def join_voice_participant(state, event_code, user_id, now):
+    state.store.join_event(event_code, user_id, {"join_time": now, "voice_ms": 0, "voice_since": now})
+
+def reconcile_presence(state, get_channel):
+    """Re-reads who is in each linked voice channel, since updates are missed while disconnected."""
+    now = now_ms()
+    for channel_id, event_code in list(state.presence.channels.items()):
+        channel = get_channel(channel_id)
+        present = {str(member.id) for member in channel.members if not member.bot} if channel is not None else set()
+        for user_id in state.presence.reconcile(event_code, present, now):
+            join_voice_participant(state, event_code, user_id, now)
+
+# --- Record History ---
+# Histories load in the background so events can be started and joined
+# while they warm up; commands that read or add records wait for them.
+histories_ready = threading.Event()
+
+def load_histories(states):
+    threads = [threading.Thread(target=state.load_history, name=f"history-loader-{state.guild_id}", daemon=True) for state in states]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    histories_ready.set()
+    startup_timings['history'] = time.perf_counter() - STARTED_AT
+    record_count = sum(state.store.count_records() for state in states)
+    logging.info(f"Loaded {record_count} event records of {len(states)} guilds, {startup_timings['history'] * 1000:.0f} ms after startup.")
+
+threading.Thread(target=load_histories, args=(list(guild_states.values()),), name="history-loader", daemon=True).start()
+
+async def require_history(state, interaction):
+    """Asks the user to retry if the guild's record history is still loading; returns whether it is ready."""
+    if state.history_ready.is_set():
+        return True
+    await interaction.response.send_message("⏳ The event history is still loading, please try again in a moment.", ephemeral=True)
+    return False
+
+# --- Metrics ---
+metrics.describe('sfl_command_duration_seconds', 'histogram', "Total time spent in a slash command handler.")
+metrics.describe('sfl_command_defer_seconds', 'histogram', "Time from entering a handler until its response was deferred.")
+metrics.describe('sfl_command_respond_seconds', 'histogram', "Time from deferring until a deferred handler finished responding.")
+metrics.describe('sfl_command_errors_total', 'counter', "Slash command handlers that raised.")
+metrics.describe('sfl_member_name_lookups_total', 'counter', "Member display name lookups by where they were answered.")
+metrics.describe('sfl_member_fetch_seconds', 'histogram', "Duration of each REST member fetch.")
+metrics.describe('sfl_response_cache_lookups_total', 'counter', "Rendered response cache lookups by result.")
+metrics.describe('sfl_voice_transitions_total', 'counter', "Voice channel joins and leaves applied to voice-linked events.")
+metrics.describe('sfl_guilds', 'gauge', "Guilds with loaded event data.")
+metrics.describe('sfl_active_events', 'gauge', "Events currently running.")
+metrics.describe('sfl_active_participants', 'gauge', "Participants across all running events.")
+metrics.describe('sfl_event_records', 'gauge', "Finalized event records.")
+metrics.gauge('sfl_guilds', lambda: len(guild_states))
+metrics.gauge('sfl_active_events', lambda: sum(len(state.active_events) for state in list(guild_states.values())))
+metrics.gauge('sfl_active_participants', lambda: sum(
+    len(event['participants']) for state in list(guild_states.values()) for _, event in state.active_events.items()
+))
+metrics.gauge('sfl_event_records', lambda: sum(state.store.count_records() for state in list(guild_states.values())))
+metrics.describe('sfl_startup_ready_seconds', 'gauge', "Seconds from process start until the bot was connected and serving commands.")
+metrics.describe('sfl_startup_history_seconds', 'gauge', "Seconds from process start until the record history was loaded.")
+metrics.gauge('sfl_startup_ready_seconds', lambda: startup_timings.get('ready', float('nan')))
+metrics.gauge('sfl_startup_history_seconds', lambda: startup_timings.get('history', float('nan')))
+
+def timed_command(func):
+    """Records the handler's latency and errors, labelled with its function name.
+
+    Metrics are switched on before the commands are defined, so with metrics
+    disabled the handler is registered unwrapped and costs nothing extra.
+    """
+    if not metrics.enabled:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(interaction, *args, **kwargs):
+        started = time.perf_counter()
+        interaction.extras['command'] = (name, started)
+        try:
+            return await func(interaction, *args, **kwargs)
+        except Exception:
+            metrics.inc('sfl_command_errors_total', command=name)
+            raise
+        finally:
+            finished = time.perf_counter()
+            metrics.observe('sfl_command_duration_seconds', finished - started, command=name)
+            deferred_at = interaction.extras.get('deferred_at')
+            if deferred_at is not None:
+                metrics.observe('sfl_command_respond_seconds', finished - deferred_at, command=name)
+    return wrapper
+
+async def defer_response(interaction, **kwargs):
+    """Defers the response, noting how long the handler took to acknowledge the interaction."""
+    await interaction.response.defer(**kwargs)
+    command = interaction.extras.get('command') if metrics.enabled else None
+    if command is not None:
+        name, started = command
+        deferred_at = interaction.extras['deferred_at'] = time.perf_counter()
+        metrics.observe('sfl_command_defer_seconds', deferred_at - started, command=name)
+
+# --- Graceful Shutdown ---
+shutdown_task = None
+
+def handle_sigterm():
+    """Stops the bot, e.g. when a newer instance takes over; the atexit hook then flushes buffered mutations.
+
+    Runs as a callback on the event loop rather than inside a signal handler,
+    which could interrupt a thread holding a store lock and deadlock on it.
+    """
+    global shutdown_task
+    if shutdown_task is None:
+        logging.info("Received SIGTERM, shutting down and flushing pending data.")
+        shutdown_task = asyncio.create_task(bot.close())
+
+def get_event_by_creator(state, creator_id):
+    """Finds an event hosted by a specific creator in a guild."""
+    return state.active_events.by_creator(creator_id)
+
+def build_event_record(member_id_str, event, start_ms, end_ms, duration_ms=None):
+    """Builds the record for one participant's stay and returns it with the unrounded duration.
+
+    Uses the event type and rate stored on the event when it started, so a
+    reloaded config never changes the points of a running event. Voice-linked
+    events pass the time spent in the channel as `duration_ms`; otherwise the
+    whole stay from `start_ms` to `end_ms` counts.
+    """
+    duration_minutes = (end_ms - start_ms if duration_ms is None else duration_ms) / 60000
+    points = max(0, round(duration_minutes * event['points_per_minute'], 2))
+
+    event_record = EventRecord(
+        user_id=member_id_str,
+        event_id=event['event_id'],
+        event_type=event['event_type'],
+        start_ms=start_ms,
+        end_ms=end_ms,
+        duration_minutes=round(duration_minutes, 2),
+        points_earned=points
+    )
+    return event_record, duration_minutes
+
+def calculate_and_finalize_points(state, member_id, event_code):
+    """Calculates points for a user, updates their record, and returns details."""
+    event = state.active_events.get(event_code)
+    # Events without a rate had an event ID that was not configured when they were loaded.
+    if not event or 'points_per_minute' not in event:
         return None
 
     member_id_str = str(member_id)
@@ -124,139 +488,456 @@ def calculate_and_finalize_points(member_id, event_code):
     if not participant_info:
         return None
 
-    event_config = EVENT_CONFIGS.get(str(event['event_id']))
-    if not event_config:
-        return None
-
-    start_time = datetime.fromisoformat(participant_info['join_time'])
-    end_time = datetime.now(timezone.utc)
-    duration_seconds = (end_time - start_time).total_seconds()
-    duration_minutes = duration_seconds / 60
-    points = max(0, round(duration_minutes * event_config.get('points_per_minute', 0), 2))
+    end_ms = now_ms()
+    duration_ms = state.presence.total_ms(event_code, member_id_str, end_ms) if event.get('voice_channel_id') else None
+    event_record, duration_minutes = build_event_record(member_id_str, event, participant_info['join_time'], end_ms, duration_ms)
 
     # Save raw event record
-    event_record = {
-        'user_id': member_id_str,
-        'event_id': event['event_id'],
-        'event_type': event_config.get('event_type'),
-        'start_time': start_time.isoformat(),
-        'end_time': end_time.isoformat(),
-        'duration_minutes': round(duration_minutes, 2),
-        'points_earned': points
-    }
-    event_records_data.append(event_record)
+    state.store.add_record(event_record)
+    state.points_index.add(event_record)
+
+    return {"points": event_record.points_earned, "duration": duration_minutes}
+
+def finalize_all_participants(state, event_code):
+    """Finalizes every participant of an event against one shared end time.
+
+    Produces the same records as calling calculate_and_finalize_points for
+    each participant, but looks the event up once and persists all records
+    as a single batch. Returns the number of records written.
+    """
+    event = state.active_events.get(event_code)
+    if not event or 'points_per_minute' not in event:
+        return 0
+
+    end_ms = now_ms()
+    if event.get('voice_channel_id'):
+        event_records = [
+            build_event_record(member_id_str, event, participant_info['join_time'], end_ms, state.presence.total_ms(event_code, member_id_str, end_ms))[0]
+            for member_id_str, participant_info in event['participants'].items()
+        ]
+    else:
+        event_records = [
+            build_event_record(member_id_str, event, participant_info['join_time'], end_ms)[0]
+            for member_id_str, participant_info in event['participants'].items()
+        ]
 
-    return {"points": points, "duration": duration_minutes}
+    state.store.add_records(event_records)
+    for event_record in event_records:
+        state.points_index.add(event_record)
+    return len(event_records)
+
+def event_type_name(event):
+    """The event type a running event started with, or its ID if that type was not configured."""
+    return event.get('event_type') or event['event_id']
 
 # --- Bot Setup ---
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-event_group = app_commands.Group(name="event", description="Manage event activity points.")
+# Shards are spread over the guilds automatically as the bot joins more of them.
+bot = commands.AutoShardedBot(command_prefix="!", intents=intents)
+event_group = app_commands.Group(name="event", description="Manage event activity points.", guild_only=True)
+
+@bot.event
+async def setup_hook():
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, handle_sigterm)
 
 @bot.event
 async def on_ready():
-    logging.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
+    global presence_checkpoint_task
+    logging.info(f'Logged in as {bot.user} (ID: {bot.user.id}) on {bot.shard_count} shards, in {len(bot.guilds)} guilds')
     try:
         bot.tree.add_command(event_group)
         synced = await bot.tree.sync()
         logging.info(f"Synced {len(synced)} commands to Discord.")
     except Exception as e:
         logging.error(f"Error syncing commands: {e}")
+    # A new session does not replay the voice updates missed while disconnected.
+    for state in list(guild_states.values()):
+        reconcile_presence(state, bot.get_channel)
+    if 'ready' not in startup_timings:
+        startup_timings['ready'] = time.perf_counter() - STARTED_AT
+        config_watcher.start()
+        presence_checkpoint_task = asyncio.create_task(checkpoint_presence_periodically())
+        logging.info(
+            f"Ready {startup_timings['ready'] * 1000:.0f} ms after startup "
+            f"(instance handoff {startup_timings.get('lock', 0) * 1000:.0f} ms, "
+            f"active events loaded at {startup_timings['load'] * 1000:.0f} ms)."
+        )
+
+@bot.event
+async def on_shard_ready(shard_id):
+    logging.info(f"Shard {shard_id} is ready.")
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    """Opens and closes presence intervals of voice-linked events; the next checkpoint persists them."""
+    if before.channel == after.channel or member.bot:
+        return
+    state = guild_states.get(member.guild.id)
+    if state is None or not state.presence.channels:
+        return
+    now = now_ms()
+    user_id = str(member.id)
+    if before.channel is not None:
+        event_code = state.presence.channels.get(before.channel.id)
+        if event_code is not None:
+            state.presence.close(event_code, user_id, now)
+            metrics.inc('sfl_voice_transitions_total', change='leave')
+    if after.channel is not None:
+        event_code = state.presence.channels.get(after.channel.id)
+        if event_code is not None:
+            if state.presence.open(event_code, user_id, now):
+                join_voice_participant(state, event_code, user_id, now)
+            metrics.inc('sfl_voice_transitions_total', change='join')
+
+# --- Member Name Resolution ---
+class MemberNameCache:
+    """TTL/LRU cache of member display names, keyed by (guild ID, user ID)."""
+
+    def __init__(self, ttl_seconds, max_size):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return name
+
+    def put(self, guild_id, user_id, name):
+        key = (guild_id, user_id)
+        self._entries[key] = (name, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, guild_id, user_id):
+        self._entries.pop((guild_id, user_id), None)
+
+member_names = MemberNameCache(MEMBER_CACHE_TTL_SECONDS, MEMBER_CACHE_MAX_SIZE)
+
+async def resolve_member_names(guild, user_ids):
+    """Maps user IDs to display names using the cache, then the gateway member cache, then REST."""
+    names = {}
+    misses = []
+    gateway_hits = 0
+    for user_id in dict.fromkeys(str(uid) for uid in user_ids):
+        name = member_names.get(guild.id, user_id)
+        if name is None:
+            member = guild.get_member(int(user_id))
+            if member is not None:
+                name = member.display_name
+                member_names.put(guild.id, user_id, name)
+                gateway_hits += 1
+        if name is None:
+            misses.append(user_id)
+        else:
+            names[user_id] = name
+    metrics.inc('sfl_member_name_lookups_total', len(names) - gateway_hits, source='cache')
+    metrics.inc('sfl_member_name_lookups_total', gateway_hits, source='gateway')
+    metrics.inc('sfl_member_name_lookups_total', len(misses), source='rest')
+
+    semaphore = asyncio.Semaphore(MEMBER_FETCH_CONCURRENCY)
+
+    async def fetch_name(user_id):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                member = await guild.fetch_member(int(user_id))
+            except discord.NotFound:
+                name = f"Unknown User (ID: {user_id})"
+            except discord.HTTPException:
+                # Transient failures are not cached so the next call can retry.
+                names[user_id] = f"Unknown User (ID: {user_id})"
+                return
+            else:
+                name = member.display_name
+            finally:
+                metrics.observe('sfl_member_fetch_seconds', time.perf_counter() - started)
+            member_names.put(guild.id, user_id, name)
+            names[user_id] = name
+
+    if misses:
+        await asyncio.gather(*(fetch_name(user_id) for user_id in misses))
+    return names
+
+@bot.event
+async def on_member_update(before, after):
+    member_names.invalidate(after.guild.id, str(after.id))
+
+@bot.event
+async def on_member_remove(member):
+    member_names.invalidate(member.guild.id, str(member.id))
+
+# --- Record Pagination ---
+def format_record_field(record, user_display_name=None):
+    """Formats a record as an embed (name, value) pair."""
+    event_date = record.start_time.strftime('%Y-%m-%d %H:%M')
+    duration_mins = record.duration_minutes
+    points = record.points_earned
+    event_type = record.event_type or 'Unknown'
+
+    field_value = (
+        f"**Event:** {event_type}\n"
+        f"**Duration:** {duration_mins:.2f} mins\n"
+        f"**Points:** {points:.2f}"
+    )
+    if user_display_name is not None:
+        field_value = f"**User:** {user_display_name}\n" + field_value
+    return f"Record - {event_date}", field_value
+
+class RecordPager(discord.ui.View):
+    """Newest-first record browser that loads one page per click through keyset cursors.
+
+    Only the cursors bounding the visible page and the page number are kept,
+    so every page costs the same time and memory however long the history is.
+    With `user` set it shows that user's records, otherwise everyone's.
+    """
+
+    def __init__(self, state, owner, user=None):
+        super().__init__(timeout=RECORD_PAGER_TIMEOUT_SECONDS)
+        self.state = state
+        self.owner_id = owner.id
+        self.user = user
+        self.page_no = 0
+        self.first_cursor = None
+        self.last_cursor = None
+        self.message = None
+
+    def record_count(self):
+        if self.user is None:
+            return self.state.store.count_records()
+        return self.state.points_index.user_totals(self.user.id)[0]
+
+    async def build_page(self, guild, before=None, after=None):
+        """Fetches the page next to the given cursor and renders it as an embed.
+
+        The first page of everyone's records looks the same to every viewer,
+        so it is rendered once until the data changes.
+        """
+        if self.user is not None or before is not None or after is not None:
+            return await self._render_page(guild, before, after)
+        cached = self.state.responses.get(('records',))
+        if cached is None:
+            embed = await self._render_page(guild)
+            self.state.responses.put(('records',), (embed, self.first_cursor, self.last_cursor, self.older_button.disabled))
+            return embed
+        embed, self.first_cursor, self.last_cursor, self.older_button.disabled = cached
+        self.newer_button.disabled = True
+        return embed
+
+    async def _render_page(self, guild, before=None, after=None):
+        user_id = None if self.user is None else self.user.id
+        page, read_page = self.state.store.begin_records_page(user_id, before=before, after=after, limit=RECORDS_PAGE_SIZE)
+        if read_page is not None:
+            page = await asyncio.to_thread(read_page)
+        if page:
+            self.first_cursor, self.last_cursor = page[0][0], page[-1][0]
+        page_records = [record for _, record in page]
+
+        record_count = self.record_count()
+        total_pages = max(1, -(-record_count // RECORDS_PAGE_SIZE))
+        self.newer_button.disabled = self.page_no == 0
+        self.older_button.disabled = not page or self.page_no + 1 >= total_pages
+
+        if self.user is None:
+            embed = Embed(
+                title="Event Participation Records",
+                description="A log of all recorded event participation.",
+                color=0x7289DA  # Discord Blurple
+            )
+            names = await resolve_member_names(guild, (record.user_id for record in page_records))
+            for record in page_records:
+                name, value = format_record_field(record, names[record.user_id])
+                embed.add_field(name=name, value=value, inline=False)
+        else:
+            embed = Embed(
+                title=f"{self.user.display_name}'s Participation Records",
+                description=f"A log of {self.user.display_name}'s recorded event participation.",
+                color=self.user.color
+            )
+            embed.set_thumbnail(url=self.user.display_avatar.url)
+            for record in page_records:
+                name, value = format_record_field(record)
+                embed.add_field(name=name, value=value, inline=False)
+            total_points = self.state.points_index.user_totals(self.user.id)[1]
+            embed.add_field(name=f"{self.user.display_name}'s Total Points", value=f"**Total Points:** {total_points:.2f}", inline=False)
+
+        embed.set_footer(text=f"Page {self.page_no + 1} of {total_pages} • {record_count} records")
+        return embed
+
+    async def interaction_check(self, interaction: Interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Only the person who ran this command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: Interaction, button: discord.ui.Button):
+        await interaction.response.defer()
+        self.page_no = max(0, self.page_no - 1)
+        # The first page always shows the newest records, including any added since.
+        after = self.first_cursor if self.page_no else None
+        embed = await self.build_page(interaction.guild, after=after)
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: Interaction, button: discord.ui.Button):
+        await interaction.response.defer()
+        self.page_no += 1
+        embed = await self.build_page(interaction.guild, before=self.last_cursor)
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
 
 # --- Slash Commands ---
 @event_group.command(name="start", description="Starts a new event and generates a join code.")
-@app_commands.describe(event_id="The unique ID of the event to start.")
-async def start(interaction: Interaction, event_id: str):
-    global active_events
-
+@app_commands.describe(
+    event_id="The unique ID of the event to start.",
+    voice_channel="Count the time members spend in this voice channel instead of using join codes."
+)
+@timed_command
+async def start(interaction: Interaction, event_id: str, voice_channel: Optional[discord.VoiceChannel] = None):
+    state = guild_state(interaction)
     creator_id = str(interaction.user.id)
-    if get_event_by_creator(creator_id)[0]:
+    # No await until the event is stored, so a double-clicked start finds the first event here.
+    if get_event_by_creator(state, creator_id)[0]:
         await interaction.response.send_message("❌ You are already hosting an event. Please stop it first.", ephemeral=True)
         return
 
-    if event_id not in EVENT_CONFIGS:
+    event_type = event_catalog.get(event_id)
+    if event_type is None:
         await interaction.response.send_message(f"❌ Event ID `{event_id}` is not valid. Use `/event id` to see available IDs.", ephemeral=True)
         return
 
+    if voice_channel is not None and voice_channel.id in state.presence.channels:
+        await interaction.response.send_message(f"❌ {voice_channel.mention} is already linked to another event.", ephemeral=True)
+        return
+
     event_code = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
-    while event_code in active_events:
+    while event_code in state.active_events:
         event_code = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
 
-    active_events[event_code] = {
+    started_at = now_ms()
+    event = {
         "creator_id": creator_id,
         "event_id": event_id,
-        "start_time": datetime.now(timezone.utc).isoformat(),
+        # Kept on the event so a config reload never changes the points of a running event.
+        "event_type": event_type.event_type,
+        "points_per_minute": event_type.points_per_minute,
+        "start_time": started_at,
         "participants": {
-            creator_id: {"join_time": datetime.now(timezone.utc).isoformat()}
+            creator_id: {"join_time": started_at}
         }
     }
-    save_data(ACTIVE_EVENTS_FILE, active_events)
+    if voice_channel is not None:
+        # Everyone already in the channel takes part from now; the creator counts only while connected.
+        event["voice_channel_id"] = str(voice_channel.id)
+        in_channel = {str(member.id) for member in voice_channel.members if not member.bot}
+        event["participants"] = {
+            user_id: {"join_time": started_at, "voice_ms": 0, "voice_since": started_at if user_id in in_channel else None}
+            for user_id in [creator_id, *in_channel]
+        }
+        state.presence.track(event_code, voice_channel.id, event["participants"])
+    state.store.start_event(event_code, event)
     
     embed = Embed(
         title="🎉 Event Started!",
-        description=f"Your event `{EVENT_CONFIGS[event_id]['event_type']}` is now active.",
+        description=f"Your event `{event_type.event_type}` is now active.",
         color=discord.Color.green()
     )
-    embed.add_field(name="Join Code", value=f"**`{event_code}`**", inline=False)
-    embed.set_footer(text="Participants can now use this code with /event join.")
+    if voice_channel is None:
+        embed.add_field(name="Join Code", value=f"**`{event_code}`**", inline=False)
+        embed.set_footer(text="Participants can now use this code with /event join.")
+    else:
+        embed.add_field(name="Voice Channel", value=voice_channel.mention, inline=False)
+        embed.set_footer(text="Time in the voice channel is counted automatically; no join code is needed.")
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @event_group.command(name="join", description="Joins an active event using a code.")
 @app_commands.describe(code="The 4-character code for the event.")
+@timed_command
 async def join(interaction: Interaction, code: str):
-    global active_events
-
+    state = guild_state(interaction)
     event_code = code.lower()
-    if event_code not in active_events:
+    participant_id = str(interaction.user.id)
+    # Waits only while a stop of this event is finishing, which then makes the code invalid.
+    async with state.event_locks.hold(event_code):
+        event = state.active_events.get(event_code)
+        # Voice-linked events count time in their channel, so joining by code would add nothing.
+        if event is not None and not event.get('voice_channel_id') and participant_id not in event['participants']:
+            state.store.join_event(event_code, participant_id, {"join_time": now_ms()})
+            joined = True
+        else:
+            joined = False
+
+    if event is None:
         await interaction.response.send_message("❌ Invalid event code.", ephemeral=True)
         return
 
-    participant_id = str(interaction.user.id)
-    if participant_id in active_events[event_code]['participants']:
+    if event.get('voice_channel_id'):
+        await interaction.response.send_message(f"🎧 This event counts the time spent in <#{event['voice_channel_id']}>. Join the voice channel to take part.", ephemeral=True)
+        return
+
+    if not joined:
         await interaction.response.send_message("🤔 You have already joined this event.", ephemeral=True)
         return
 
-    active_events[event_code]['participants'][participant_id] = {"join_time": datetime.now(timezone.utc).isoformat()}
-    save_data(ACTIVE_EVENTS_FILE, active_events)
-    
-    event_id = active_events[event_code]['event_id']
-    event_type = EVENT_CONFIGS[event_id]['event_type']
+    event_type = event_type_name(event)
     await interaction.response.send_message(f"✅ You have successfully joined the event: **{event_type}**.", ephemeral=True)
 
 @event_group.command(name="stop", description="Stops the event you are hosting and calculates points.")
+@timed_command
 async def stop(interaction: Interaction):
-    global active_events
-    global event_records_data
-
+    state = guild_state(interaction)
     creator_id = str(interaction.user.id)
-    event_code, event = get_event_by_creator(creator_id)
+    event_code, event = get_event_by_creator(state, creator_id)
 
     if not event:
         await interaction.response.send_message("❌ You are not currently hosting an event.", ephemeral=True)
         return
 
-    await interaction.response.defer(ephemeral=True)
-    
-    participant_ids = list(event['participants'].keys())
-    for pid in participant_ids:
-        calculate_and_finalize_points(pid, event_code)
+    if not await require_history(state, interaction):
+        return
 
-    del active_events[event_code]
-    save_data(EVENT_RECORDS_FILE, event_records_data)
-    save_data(ACTIVE_EVENTS_FILE, active_events)
-    
-    event_type = EVENT_CONFIGS[event['event_id']]['event_type']
+    # Held across the defer so a second stop or a kick can't finalize the same participants meanwhile.
+    async with state.event_locks.hold(event_code):
+        # Codes are reused once free, so compare the event itself rather than its code.
+        if state.active_events.get(event_code) is not event:
+            await interaction.response.send_message("✅ This event has already been stopped.", ephemeral=True)
+            return
+
+        await defer_response(interaction, ephemeral=True)
+
+        finalize_all_participants(state, event_code)
+        state.store.end_event(event_code)
+        state.presence.untrack(event_code)
+
+    event_type = event_type_name(event)
     await interaction.followup.send(f"✅ Event `{event_type}` has been stopped. Points have been calculated for all participants.", ephemeral=True)
 
 @event_group.command(name="kick", description="Removes a participant from your event.")
 @app_commands.describe(member="The member to remove from the event.")
+@timed_command
 async def kick(interaction: Interaction, member: Member):
-    global active_events
-
+    state = guild_state(interaction)
     creator_id = str(interaction.user.id)
-    event_code, event = get_event_by_creator(creator_id)
+    event_code, event = get_event_by_creator(state, creator_id)
 
     if not event:
         await interaction.response.send_message("❌ You are not currently hosting an event.", ephemeral=True)
@@ -271,17 +952,30 @@ async def kick(interaction: Interaction, member: Member):
         await interaction.response.send_message("❌ You cannot kick yourself. Use `/event stop` to end the event.", ephemeral=True)
         return
 
-    result = calculate_and_finalize_points(member_id_str, event_code)
-    del event['participants'][member_id_str]
-    save_data(ACTIVE_EVENTS_FILE, active_events)
+    if not await require_history(state, interaction):
+        return
+
+    async with state.event_locks.hold(event_code):
+        # A stop or another kick may have finalized them while this one waited.
+        still_in_event = state.active_events.get(event_code) is event and member_id_str in event['participants']
+        if still_in_event:
+            result = calculate_and_finalize_points(state, member_id_str, event_code)
+            state.store.leave_event(event_code, member_id_str)
+            if event.get('voice_channel_id'):
+                state.presence.drop(event_code, member_id_str)
+
+    if not still_in_event:
+        await interaction.response.send_message(f"❌ {member.display_name} is no longer in your event.", ephemeral=True)
+        return
 
     points_msg = f"{result['points']:.2f} points" if result else "0 points"
     await interaction.response.send_message(f"✅ {member.display_name} has been kicked and awarded {points_msg}.", ephemeral=True)
 
 @event_group.command(name="list", description="Lists all participants in your current event.")
+@timed_command
 async def list_participants(interaction: Interaction):
     creator_id = str(interaction.user.id)
-    event_code, event = get_event_by_creator(creator_id)
+    event_code, event = get_event_by_creator(guild_state(interaction), creator_id)
 
     if not event:
         await interaction.response.send_message("❌ You are not currently hosting an event.", ephemeral=True)
@@ -292,217 +986,484 @@ async def list_participants(interaction: Interaction):
         await interaction.response.send_message("텅 Your event has no participants yet.", ephemeral=True)
         return
         
-    participant_list = []
-    for pid in participant_ids:
-        try:
-            member = await interaction.guild.fetch_member(int(pid))
-            participant_list.append(member.display_name)
-        except (discord.NotFound, discord.HTTPException):
-            participant_list.append(f"Unknown User (ID: {pid})")
+    names = await resolve_member_names(interaction.guild, participant_ids)
+    participant_list = [names[pid] for pid in participant_ids]
 
-    event_type = EVENT_CONFIGS[event['event_id']]['event_type']
+    event_type = event_type_name(event)
     embed = Embed(title=f"Participants in '{event_type}'", description="> " + "\n> ".join(participant_list), color=discord.Color.blue())
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @event_group.command(name="me", description="Shows your total activity points and event history.")
+@timed_command
 async def me(interaction: Interaction):
     """Displays all event records of an user."""
-    global event_records_data
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
 
-    if not event_records_data:
+    record_count, total_points = state.points_index.user_totals(interaction.user.id)
+    if not record_count:
         await interaction.response.send_message("You don't have event records yet.", ephemeral=True)
         return
 
-    await interaction.response.defer(ephemeral=True)
-
-    embed = Embed(
-        title=f"{interaction.user.display_name}'s Participation Records",
-        description=f"A log of {interaction.user.display_name}'s recorded event participation.",
-        color=interaction.user.color
-    )
-    embed.set_thumbnail(url=interaction.user.display_avatar.url)
-
-    # Filter out user specific event records
-    filtered_records = [d for d in event_records_data if d['user_id'] == str(interaction.user.id)]
-
-    # Sort records by start time, newest first
-    sorted_records = sorted(filtered_records, key=lambda x: x['start_time'], reverse=True)
-
-    record_fields = []
-    total_points = 0.0
-    for record in sorted_records:
-        event_date = datetime.fromisoformat(record['start_time']).strftime('%Y-%m-%d %H:%M')
-        duration_mins = record.get('duration_minutes', 0.0)
-        points = record.get('points_earned', 0.0)
-        event_type = record.get('event_type', 'Unknown')
-
-        field_value = (
-            f"**Event:** {event_type}\n"
-            f"**Duration:** {duration_mins:.2f} mins\n"
-            f"**Points:** {points:.2f}"
-        )
-        record_fields.append((f"Record - {event_date}", field_value))
-
-        total_points = total_points + points
+    await defer_response(interaction, ephemeral=True)
 
-    # Add fields to the embed
-    for name, value in record_fields:
-        embed.add_field(name=name, value=value, inline=False)
-
-    # Add total points to the embed
-    embed.add_field(name=f"{interaction.user.display_name}'s Total Points", value=f"**Total Points:** {total_points:.2f}", inline=False)
-
-    if len(sorted_records) > 20:
-        embed.set_footer(text=f"Showing the last 20 of {len(sorted_records)} records.")
-
-    await interaction.followup.send(embed=embed, ephemeral=True)
+    view = RecordPager(state, interaction.user, user=interaction.user)
+    embed = await view.build_page(interaction.guild)
+    view.message = await interaction.followup.send(embed=embed, view=view, ephemeral=True, wait=True)
 
 @event_group.command(name="id", description="Lists all available event IDs and their types.")
+@timed_command
 async def id(interaction: Interaction):
-    if not EVENT_CONFIGS:
+    if event_id_embed is None:
         await interaction.response.send_message("No event types are configured.", ephemeral=True)
         return
-    
-    embed = Embed(title="Available Event IDs & Types", color=discord.Color.blue())
-    id_list = [f"`{eid}` - {details['event_type']}" for eid, details in EVENT_CONFIGS.items()]
-    embed.description = "\n".join(id_list)
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    await interaction.response.send_message(embed=event_id_embed, ephemeral=True)
+
+# --- Leaderboard Windows ---
+def record_window(period=None, start_date=None, end_date=None, event_id=None, event_type=None):
+    """Turns the /event summary and /event export options into DailyRollups arguments and a label.
+
+    Returns an empty window for the all-time leaderboard. Raises ValueError
+    with a message for the user when the options are invalid.
+    """
+    window = {}
+    labels = []
+    if period is not None and (start_date or end_date):
+        raise ValueError("Use either a period or a date range, not both.")
+
+    if period is not None:
+        today = day_of(now_ms())
+        window['first_day'] = today - period.value + 1
+        window['last_day'] = today
+        labels.append(period.name)
+    if start_date or end_date:
+        try:
+            if start_date:
+                window['first_day'] = day_of_date(datetime.strptime(start_date, '%Y-%m-%d').date())
+            if end_date:
+                window['last_day'] = day_of_date(datetime.strptime(end_date, '%Y-%m-%d').date())
+        except ValueError:
+            raise ValueError("Dates must be written as YYYY-MM-DD.")
+        if start_date and end_date:
+            if window['first_day'] > window['last_day']:
+                raise ValueError("The start date must not be after the end date.")
+            labels.append(f"{start_date} to {end_date}")
+        else:
+            labels.append(f"From {start_date}" if start_date else f"Until {end_date}")
+
+    if event_id is not None:
+        configured = event_catalog.get(event_id)
+        if configured is None:
+            raise ValueError(f"Event ID `{event_id}` is not valid. Use `/event id` to see available IDs.")
+        window['event_id'] = event_id
+        labels.append(configured.event_type)
+    if event_type is not None:
+        type_name = event_catalog.type_named(event_type)
+        if type_name is None:
+            raise ValueError(f"Event type `{event_type}` is not configured. Use `/event id` to see available types.")
+        window['event_type'] = type_name
+        if event_id is None:
+            labels.append(type_name)
+
+    if labels:
+        labels.append("days in UTC")
+    return window, " • ".join(labels)
+
+async def event_id_autocomplete(interaction: Interaction, current: str):
+    current = current.lower()
+    return [
+        app_commands.Choice(name=event_type.choice_name, value=event_type.event_id)
+        for event_type in event_catalog.values()
+        if current in event_type.event_id or current in event_type.event_type.lower()
+    ][:25]
+
+async def event_type_autocomplete(interaction: Interaction, current: str):
+    current = current.lower()
+    return [
+        app_commands.Choice(name=event_type[:100], value=event_type)
+        for event_type in event_catalog.type_names()
+        if current in event_type.lower()
+    ][:25]
 
 @event_group.command(name="summary", description="Displays the point leaderboard for the server.")
-async def summary(interaction: Interaction):
-    global event_records_data
+@app_commands.describe(
+    period="Only count recent days.",
+    start_date="Only count records from this day on (YYYY-MM-DD, UTC).",
+    end_date="Only count records up to and including this day (YYYY-MM-DD, UTC).",
+    event_id="Only count this event ID.",
+    event_type="Only count this event type."
+)
+@app_commands.choices(period=SUMMARY_PERIODS)
+@app_commands.autocomplete(event_id=event_id_autocomplete, event_type=event_type_autocomplete)
+@timed_command
+async def summary(
+    interaction: Interaction,
+    period: Optional[app_commands.Choice[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    event_id: Optional[str] = None,
+    event_type: Optional[str] = None
+):
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
 
-    if not event_records_data:
+    if not len(state.points_index):
         await interaction.response.send_message("No points have been recorded yet.", ephemeral=True)
         return
 
-    await interaction.response.defer(ephemeral=True)
+    try:
+        window, window_label = record_window(period, start_date, end_date, event_id, event_type)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
 
-    points_data = {}
-    for record in event_records_data:
-        try:
-            user = await interaction.guild.fetch_member(int(record['user_id']))
-            user_display_name = user.display_name
-        except (NotFound, HTTPException):
-            user_display_name = f"Unknown User (ID: {record['user_id']})"
+    # The same window is rendered once until a record is added; relative periods resolve to days first.
+    cache_key = ('summary', tuple(sorted(window.items())), window_label)
+    embed = state.responses.get(cache_key)
+    if embed is not None:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
 
-        user_points = points_data.setdefault(user_display_name, {'total_points': 0})
-        user_points['total_points'] = user_points['total_points'] + record.get('points_earned', 0.0)
+    await defer_response(interaction, ephemeral=True)
 
-    sorted_users = sorted(points_data.items(), key=lambda item: item[1].get('total_points', 0), reverse=True)
+    # Windowed leaderboards combine the daily rollups of the days in the window.
+    sorted_users = state.points_index.daily.top(50, **window) if window else state.points_index.top(50)
+    names = await resolve_member_names(interaction.guild, (user_id for user_id, _ in sorted_users))
 
     embed = Embed(title="🏆 Activity Point Leaderboard", color=discord.Color.gold())
+    if window_label:
+        embed.set_footer(text=window_label)
     
     if not sorted_users:
         embed.description = "The leaderboard is empty."
-        await interaction.followup.send(embed=embed)
-        return
-
-    leaderboard_text = ""
-    for i, (member_name, data) in enumerate(sorted_users[:50], 1):
-        total_points = data.get('total_points', 0)
-        leaderboard_text += f"**{i}.** {member_name} - **{total_points:.2f}** points\n"
+    else:
+        leaderboard_text = ""
+        for i, (user_id, total_points) in enumerate(sorted_users, 1):
+            leaderboard_text += f"**{i}.** {names[user_id]} - **{total_points:.2f}** points\n"
+        embed.description = leaderboard_text
 
-    embed.description = leaderboard_text
+    state.responses.put(cache_key, embed)
     await interaction.followup.send(embed=embed)
 
 @event_group.command(name="records", description="Shows all event participation records.")
+@timed_command
 async def records(interaction: Interaction):
     """Displays all event records of all users."""
-    global event_records_data
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
 
-    if not event_records_data:
+    if not state.store.count_records():
         await interaction.response.send_message("There are no event records yet.", ephemeral=True)
         return
 
-    await interaction.response.defer(ephemeral=True)
+    await defer_response(interaction, ephemeral=True)
+
+    view = RecordPager(state, interaction.user)
+    embed = await view.build_page(interaction.guild)
+    view.message = await interaction.followup.send(embed=embed, view=view, ephemeral=True, wait=True)
+
+# --- Export & Import ---
+def archive_files(state):
+    """Lists a guild's importable files: reset backups in its data directory and exports, newest first."""
+    candidates = [
+        entry for folder in (state.data_dir, state.exports_dir) for entry in os.scandir(folder)
+        if entry.is_file() and entry.name.startswith(('event_records_backup_', 'event_records_export_'))
+    ]
+    return sorted(candidates, key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+async def archive_file_autocomplete(interaction: Interaction, current: str):
+    current = current.lower()
+    return [app_commands.Choice(name=entry.name, value=entry.name) for entry in archive_files(guild_state(interaction)) if current in entry.name.lower()][:25]
+
+@event_group.command(name="export", description="[ADMIN] Exports event records as a CSV or JSON Lines file.")
+@app_commands.describe(
+    format="File format (default CSV).",
+    start_date="Only export records from this day on (YYYY-MM-DD, UTC).",
+    end_date="Only export records up to and including this day (YYYY-MM-DD, UTC).",
+    member="Only export this member's records.",
+    event_id="Only export this event ID.",
+    event_type="Only export this event type."
+)
+@app_commands.choices(format=[app_commands.Choice(name=name, value=fmt) for fmt, name in zip(EXPORT_FORMATS, ("CSV", "JSON Lines"))])
+@app_commands.autocomplete(event_id=event_id_autocomplete, event_type=event_type_autocomplete)
+@app_commands.checks.has_permissions(administrator=True)
+@timed_command
+async def export(
+    interaction: Interaction,
+    format: Optional[app_commands.Choice[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    member: Optional[Member] = None,
+    event_id: Optional[str] = None,
+    event_type: Optional[str] = None
+):
+    """Streams the matching records into a file in the background and attaches it."""
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
 
-    embed = Embed(
-        title="Event Participation Records",
-        description="A log of all recorded event participation.",
-        color=0x7289DA  # Discord Blurple
+    try:
+        window, _ = record_window(None, start_date, end_date, event_id, event_type)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    await defer_response(interaction, ephemeral=True)
+
+    fmt = format.value if format else 'csv'
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_name = f"event_records_export_{timestamp}.{fmt}"
+    file_path = os.path.join(state.exports_dir, file_name)
+    records = state.store.iter_records(
+        user_id=member.id if member else None,
+        event_id=window.get('event_id'),
+        event_type=window.get('event_type'),
+        start_ms=window['first_day'] * MS_PER_DAY if 'first_day' in window else None,
+        end_ms=(window['last_day'] + 1) * MS_PER_DAY if 'last_day' in window else None,
     )
 
-    # Sort records by start time, newest first
-    sorted_records = sorted(event_records_data, key=lambda x: x['start_time'], reverse=True)
-    
-    # Limit to the most recent 20 records to avoid hitting Discord's embed limits
-    records_to_display = sorted_records[:20]
+    try:
+        count = await asyncio.to_thread(write_records, records, file_path, fmt)
+    except Exception as e:
+        logging.error(f"Failed to export event records: {e}")
+        await interaction.followup.send("❌ **Error:** Could not export event records.", ephemeral=True)
+        return
 
-    record_fields = []
-    for record in records_to_display:
-        try:
-            user = await interaction.guild.fetch_member(int(record['user_id']))
-            user_display_name = user.display_name
-        except (NotFound, HTTPException):
-            user_display_name = f"Unknown User (ID: {record['user_id']})"
-
-        event_date = datetime.fromisoformat(record['start_time']).strftime('%Y-%m-%d %H:%M')
-        duration_mins = record.get('duration_minutes', 0.0)
-        points = record.get('points_earned', 0.0)
-        event_type = record.get('event_type', 'Unknown')
-        
-        field_value = (
-            f"**User:** {user_display_name}\n"
-            f"**Event:** {event_type}\n"
-            f"**Duration:** {duration_mins:.2f} mins\n"
-            f"**Points:** {points:.2f}"
+    if not count:
+        os.remove(file_path)
+        await interaction.followup.send("No event records match these filters.", ephemeral=True)
+        return
+
+    size_limit = interaction.guild.filesize_limit if interaction.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+    if os.path.getsize(file_path) > size_limit:
+        logging.info(f"Exported {count} event records to {file_path}")
+        await interaction.followup.send(
+            f"✅ Exported {count} records, but the file is too large to upload. "
+            f"It has been saved on the server as `{file_name}` in the exports folder.",
+            ephemeral=True
         )
-        record_fields.append((f"Record - {event_date}", field_value))
+        return
 
-    # Add fields to the embed
-    for name, value in record_fields:
-        embed.add_field(name=name, value=value, inline=False)
+    await interaction.followup.send(f"✅ Exported {count} records.", file=discord.File(file_path), ephemeral=True)
+    os.remove(file_path)
 
-    if len(sorted_records) > 20:
-        embed.set_footer(text=f"Showing the last 20 of {len(sorted_records)} records.")
+@event_group.command(name="import", description="[ADMIN] Adds the records of a backup or export file back into the history.")
+@app_commands.describe(file="A reset backup or export file from the data folder.")
+@app_commands.autocomplete(file=archive_file_autocomplete)
+@app_commands.checks.has_permissions(administrator=True)
+@timed_command
+async def import_records(interaction: Interaction, file: str):
+    """Reads an archive in batches off the event loop and appends each batch as one mutation.
+
+    Records already in the history are skipped, so importing a file twice adds nothing the second time.
+    """
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
+
+    paths = {entry.name: entry.path for entry in archive_files(state)}
+    if file not in paths:
+        await interaction.response.send_message(f"❌ `{file}` is not a backup or export file in the data folder.", ephemeral=True)
+        return
+
+    await defer_response(interaction, ephemeral=True)
+
+    imported = skipped = 0
+    try:
+        known = await asyncio.to_thread(stored_keys, state.store, paths[file])
+        batches = read_batches(paths[file])
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            new_records = [event_record for event_record in batch if event_record not in known]
+            skipped += len(batch) - len(new_records)
+            if not new_records:
+                continue
+            # Mutations stay on the event loop so they never interleave with a command's.
+            state.store.add_records(new_records)
+            for event_record in new_records:
+                state.points_index.add(event_record)
+            imported += len(new_records)
+    except Exception as e:
+        logging.error(f"Failed to import event records from {file}: {e}")
+        await interaction.followup.send(
+            f"❌ **Error:** Could not read `{file}` after importing {imported} records: {e}",
+            ephemeral=True
+        )
+        return
 
-    await interaction.followup.send(embed=embed, ephemeral=True)
+    logging.info(f"Imported {imported} event records from {file}, skipped {skipped} already in the history")
+    message = f"✅ Imported {imported} records from `{file}`."
+    if skipped:
+        message += f" Skipped {skipped} records that are already in the history."
+    await interaction.followup.send(message, ephemeral=True)
 
 # Enhanced /event reset command to backup and clear event records
 @event_group.command(name="reset", description="[ADMIN] Backs up and clears all event data.")
 @app_commands.checks.has_permissions(administrator=True)
+@timed_command
 async def reset(interaction: Interaction):
-    """Backs up event records, then clears all active events and recorded points."""
-    global active_events
-    global event_records_data
+    """Backs up the guild's event records, then clears its active events and recorded points."""
+    state = guild_state(interaction)
+    if not await require_history(state, interaction):
+        return
 
-    # Backup event_records.json
+    # Backup event records from the store, since recent ones may only be in the journal
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_file_name = f"event_records_backup_{timestamp}.json"
-    backup_file_path = os.path.join(DATA_DIR, backup_file_name)
+    backup_file_path = os.path.join(state.data_dir, backup_file_name)
 
-    try:
-        if os.path.exists(EVENT_RECORDS_FILE):
-            shutil.copy(EVENT_RECORDS_FILE, backup_file_path)
+    await defer_response(interaction, ephemeral=True)
+
+    # Commands keep running while the backup is written, so it is rewritten
+    # until no record was added meanwhile; only records it holds may be cleared.
+    for attempt in range(1, RESET_BACKUP_ATTEMPTS + 1):
+        generation = state.store.record_generation
+        try:
+            await asyncio.to_thread(write_records_json, backup_file_path, state.store.snapshot_records())
+        except Exception as e:
+            logging.error(f"Failed to back up event records: {e}")
+            await interaction.followup.send(
+                "\u274c **Error:** Could not back up event records. Reset operation aborted.",
+                ephemeral=True
+            )
+            return
+        if state.store.record_generation == generation:
             logging.info(f"Successfully backed up event records to {backup_file_path}")
-    except Exception as e:
-        logging.error(f"Failed to back up event records: {e}")
-        await interaction.response.send_message(
-            "\u274c **Error:** Could not back up event records. Reset operation aborted.",
+            break
+        logging.info(f"Event records changed while backing them up (attempt {attempt}), writing the backup again.")
+    else:
+        logging.warning(f"Event records kept changing during {RESET_BACKUP_ATTEMPTS} backup attempts, reset aborted.")
+        await interaction.followup.send(
+            "\u274c **Error:** Event records kept changing while they were being backed up. Reset operation aborted, please try again.",
             ephemeral=True
         )
         return
 
-    # Clear data in memory and files
-    active_events.clear()
-    event_records_data.clear()
-    save_data(ACTIVE_EVENTS_FILE, {})
-    save_data(EVENT_RECORDS_FILE, [])
+    # Clear data in memory and files; no await in between keeps the totals consistent
+    state.store.reset()
+    state.points_index.clear()
+    state.presence.clear()
+    state.store.compact()
 
-    await interaction.response.send_message(
+    await interaction.followup.send(
         f"**\u2705 All event data and points have been reset.**\n"
         f"Previous records have been backed up to `{backup_file_name}`.",
         ephemeral=True
     )
 
+@event_group.command(name="stats", description="[ADMIN] Shows command latencies, persistence and cache statistics.")
+@app_commands.checks.has_permissions(administrator=True)
+@timed_command
+async def stats(interaction: Interaction):
+    """Summarizes the collected metrics; the full set is served on the /metrics endpoint."""
+    if not metrics.enabled:
+        await interaction.response.send_message("Metrics are disabled. Set `metrics.enabled` in config.json to collect them.", ephemeral=True)
+        return
+
+    embed = Embed(title="📊 Bot Statistics", color=discord.Color.blurple())
+
+    command_lines = []
+    for labels, histogram in sorted(metrics.histograms('sfl_command_duration_seconds').items()):
+        command = dict(labels)['command']
+        command_lines.append(
+            f"`{command}` - {histogram.count} calls, "
+            f"p50 {histogram.quantile(0.5) * 1000:.1f} ms, p95 {histogram.quantile(0.95) * 1000:.1f} ms"
+        )
+    embed.add_field(name="Commands", value="\n".join(command_lines) or "No commands handled yet.", inline=False)
+
+    defer = metrics.histogram_total('sfl_command_defer_seconds')
+    respond = metrics.histogram_total('sfl_command_respond_seconds')
+    errors = metrics.counter_total('sfl_command_errors_total')
+    embed.add_field(
+        name="Deferred Responses",
+        value=(
+            f"**Time to defer (p95):** {defer.quantile(0.95) * 1000:.1f} ms\n"
+            f"**Time to respond after deferring (p95):** {respond.quantile(0.95) * 1000:.1f} ms\n"
+            f"**Errors:** {errors}"
+        ),
+        inline=False
+    )
+
+    flushes = metrics.histogram_total('sfl_store_flush_seconds')
+    mean_flush_ms = flushes.sum / flushes.count * 1000 if flushes.count else 0.0
+    embed.add_field(
+        name=f"Persistence ({STORAGE_BACKEND})",
+        value=(
+            f"**Flushes:** {flushes.count} (mean {mean_flush_ms:.2f} ms, p95 {flushes.quantile(0.95) * 1000:.2f} ms)\n"
+            f"**Mutations written:** {metrics.counter_total('sfl_store_flush_ops_total')}\n"
+            f"**Journal bytes written:** {metrics.counter_total('sfl_store_flush_bytes_total')}"
+        ),
+        inline=False
+    )
+
+    lookups = metrics.counter_total('sfl_member_name_lookups_total')
+    cached = lookups - metrics.counter_total('sfl_member_name_lookups_total', source='rest')
+    hit_rate = cached / lookups * 100 if lookups else 0.0
+    embed.add_field(
+        name="Member Names",
+        value=(
+            f"**Lookups:** {lookups} ({hit_rate:.1f}% served without REST)\n"
+            f"**REST fetches:** {metrics.histogram_total('sfl_member_fetch_seconds').count}"
+        ),
+        inline=False
+    )
+
+    lookups = metrics.counter_total('sfl_response_cache_lookups_total')
+    hits = metrics.counter_total('sfl_response_cache_lookups_total', result='hit')
+    hit_rate = hits / lookups * 100 if lookups else 0.0
+    embed.add_field(
+        name="Rendered Responses",
+        value=f"**Cache lookups:** {lookups} ({hit_rate:.1f}% served from cache)",
+        inline=False
+    )
+
+    # Activity is this guild's own; the /metrics gauges add up every guild.
+    state = guild_state(interaction)
+    embed.add_field(
+        name="Activity",
+        value=(
+            f"**Active events:** {len(state.active_events)}\n"
+            f"**Participants:** {sum(len(event['participants']) for _, event in state.active_events.items())}\n"
+            f"**Records:** {state.store.count_records()}\n"
+            f"**Guilds served:** {metrics.gauge_value('sfl_guilds')}"
+        ),
+        inline=False
+    )
+
+    def startup_phase(name):
+        return f"{startup_timings[name] * 1000:.0f} ms" if name in startup_timings else "pending"
+
+    embed.add_field(
+        name="Startup",
+        value=(
+            f"**Ready:** {startup_phase('ready')}\n"
+            f"**History loaded:** {startup_phase('history')}"
+        ),
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @reset.error
-async def reset_error(interaction: Interaction, error: app_commands.AppCommandError):
+@stats.error
+@export.error
+@import_records.error
+async def admin_command_error(interaction: Interaction, error: app_commands.AppCommandError):
     if isinstance(error, app_commands.MissingPermissions):
         await interaction.response.send_message(
             "❌ You do not have permission to use this command.",
             ephemeral=True
         )
+    elif interaction.response.is_done():
+        await interaction.followup.send(
+            f"An unexpected error occurred: {error}",
+            ephemeral=True
+        )
     else:
         await interaction.response.send_message(
             f"An unexpected error occurred: {error}",
@@ -511,5 +1472,7 @@ async def reset_error(interaction: Interaction, error: app_commands.AppCommandEr
 
 # --- Final Bot Run ---
 if __name__ == "__main__":
+    if metrics.enabled:
+        start_http_server(METRICS_CONFIG.get('host', '127.0.0.1'), METRICS_CONFIG.get('port', 9108))
     if DISCORD_TOKEN:
         bot.run(DISCORD_TOKEN)
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+from types import MappingProxyType
+from typing import NamedTuple
+
+EVENT_FIELDS = ('event_id', 'event_type', 'points_per_minute')
+CHOICE_NAME_LIMIT = 100
+
+class EventType(NamedTuple):
+    """One configured event type, with the strings the commands display rendered up front."""
+    event_id: str
+    event_type: str
+    points_per_minute: float
+    label: str        # "`101` - Community Hangout", one line of /event id
+    choice_name: str  # "101 - Community Hangout", cut to Discord's autocomplete limit
+
+class EventCatalog:
+    """Immutable map of event ID to EventType, compiled from the 'events' section of config.json.
+
+    A reload compiles a new catalog and swaps the reference, so a handler
+    that keeps the catalog it started with sees one consistent config.
+    """
+
+    __slots__ = ('_types', '_names', 'id_list')
+
+    def __init__(self, event_types):
+        self._types = MappingProxyType({event_type.event_id: event_type for event_type in event_types})
+        names = {}
+        for event_type in event_types:
+            names.setdefault(event_type.event_type.lower(), event_type.event_type)
+        self._names = MappingProxyType(names)
+        self.id_list = "\n".join(event_type.label for event_type in event_types)
+
+    def get(self, event_id):
+        return self._types.get(event_id)
+
+    def values(self):
+        return self._types.values()
+
+    def type_named(self, name):
+        """Returns the configured spelling of an event type name, matched case-insensitively, or None."""
+        return self._names.get(name.lower())
+
+    def type_names(self):
+        """Returns the distinct event type names in config order."""
+        return tuple(self._names.values())
+
+    def __contains__(self, event_id):
+        return event_id in self._types
+
+    def __iter__(self):
+        return iter(self._types)
+
+    def __len__(self):
+        return len(self._types)
+
+def compile_catalog(config):
+    """Validates the 'events' section of a parsed config.json and compiles it into an EventCatalog.
+
+    Raises ValueError naming the first problem found.
+    """
+    events = config.get('events') if isinstance(config, dict) else None
+    if not isinstance(events, list):
+        raise ValueError("'events' must be a list of event types.")
+
+    event_types = []
+    for position, event in enumerate(events, 1):
+        if not isinstance(event, dict):
+            raise ValueError(f"Event #{position} must be an object.")
+        missing = [field for field in EVENT_FIELDS if field not in event]
+        if missing:
+            raise ValueError(f"Event #{position} is missing {', '.join(missing)}.")
+
+        event_id = str(event['event_id']).strip()
+        event_type = event['event_type']
+        rate = event['points_per_minute']
+        if not event_id:
+            raise ValueError(f"Event #{position} has an empty event_id.")
+        if any(existing.event_id == event_id for existing in event_types):
+            raise ValueError(f"Event ID {event_id} is configured more than once.")
+        if not isinstance(event_type, str) or not event_type.strip():
+            raise ValueError(f"Event {event_id} needs a non-empty event_type.")
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not 0 <= rate < float('inf'):
+            raise ValueError(f"Event {event_id} needs a points_per_minute of 0 or more.")
+
+        event_types.append(EventType(
+            event_id=sys.intern(event_id),
+            event_type=sys.intern(event_type),
+            points_per_minute=rate,
+            label=f"`{event_id}` - {event_type}",
+            choice_name=f"{event_id} - {event_type}"[:CHOICE_NAME_LIMIT],
+        ))
+    return EventCatalog(event_types)
+
+def load_config(config_file):
+    """Reads and validates config.json, returning (config, catalog). Raises OSError or ValueError."""
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    return config, compile_catalog(config)
+
+class ConfigWatcher:
+    """Polls config.json's modification time and hands every valid new version to `on_change`.
+
+    Each poll costs one stat call. A file that fails to parse or validate
+    (e.g. one caught half-written) is logged and skipped, so the current
+    config stays in place until the next valid save.
+    """
+
+    def __init__(self, config_file, on_change, interval_seconds):
+        self.config_file = config_file
+        self.on_change = on_change
+        self.interval_seconds = interval_seconds
+        self._stamp = self._stat()
+        self._task = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.config_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Applies the config if the file changed since the last check; returns whether it did."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            config, catalog = load_config(self.config_file)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring the changed {self.config_file} and keeping the current config: {e}")
+            return False
+        self.on_change(config, catalog)
+        return True
+
+    def start(self):
+        """Polls from a task on the running event loop, so `on_change` runs between handler steps."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                self.check()
+            except Exception:
+                logging.exception(f"Could not apply the changed {self.config_file}.")
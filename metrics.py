@@ -0,0 +1,201 @@
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, spanning in-memory commands up to slow REST round trips.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- Histogram ---
+class Histogram:
+    """Fixed-bucket latency histogram; `counts[i]` holds observations in bucket i only."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def copy(self):
+        copy = Histogram(self.buckets)
+        copy.merge(self)
+        return copy
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating inside its bucket, like PromQL's histogram_quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+# --- Registry ---
+class Metrics:
+    """Process-wide counters, gauges and histograms, rendered in the Prometheus text format.
+
+    While `enabled` is false, `inc` and `observe` return before taking the
+    lock or building a label key, so instrumented hot paths pay for one
+    attribute check. Gauges are callbacks evaluated only when rendered.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._families = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def describe(self, name, kind, help_text):
+        """Registers the TYPE and HELP lines of a metric family."""
+        self._families[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, callback):
+        """Registers a gauge whose value is read from `callback` at render time."""
+        self._gauges[name] = callback
+
+    # --- Reading ---
+    def counter_total(self, name, **labels):
+        """Sums the counter series whose labels include `labels`."""
+        wanted = labels.items()
+        with self._lock:
+            return sum(value for (family, series), value in self._counters.items() if family == name and wanted <= dict(series).items())
+
+    def histograms(self, name):
+        """Returns {labels: Histogram copy} for every series of a histogram."""
+        with self._lock:
+            return {labels: histogram.copy() for (family, labels), histogram in self._histograms.items() if family == name}
+
+    def histogram_total(self, name):
+        """Merges every series of a histogram into one."""
+        total = Histogram()
+        for histogram in self.histograms(name).values():
+            total.merge(histogram)
+        return total
+
+    def gauge_value(self, name):
+        return self._gauges[name]()
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: histogram.copy() for key, histogram in self._histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                help_text = self._families.get(name, (kind, ''))[1]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        for name, callback in sorted(self._gauges.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                logging.warning(f"Could not read gauge {name}: {e}")
+                continue
+            header(name, 'gauge')
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+metrics = Metrics()
+
+# --- HTTP Endpoint ---
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(host, port):
+    """Serves GET /metrics from a daemon thread and returns the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+class Timer:
+    """Context manager that observes its elapsed time into a histogram."""
+
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
@@ -0,0 +1,114 @@
+class PresenceTracker:
+    """Voice presence intervals of one guild's voice-linked events.
+
+    Each participant has the milliseconds of their closed intervals and the
+    start of their open one, so a voice state change costs a couple of dict
+    lookups however many times people drop in and out. Changes stay in
+    memory; `checkpoint` hands back what changed so the caller can persist
+    it as one mutation per event every few seconds instead of one per
+    transition.
+    """
+
+    def __init__(self):
+        self.channels = {}  # voice channel ID -> event code
+        self._events = {}   # event code -> {user ID: [closed_ms, open_since_ms or None]}
+        self._dirty = {}    # event code -> user IDs changed since the last checkpoint
+
+    def track(self, event_code, channel_id, participants):
+        """Starts tracking an event from its participants, e.g. when it starts or is loaded."""
+        self.channels[int(channel_id)] = event_code
+        self._events[event_code] = {
+            user_id: [participant.get('voice_ms', 0), participant.get('voice_since')]
+            for user_id, participant in participants.items()
+        }
+        self._dirty[event_code] = set()
+
+    def load(self, active_events):
+        """Tracks every voice-linked event among the loaded active events."""
+        for event_code, event in active_events.items():
+            if event.get('voice_channel_id'):
+                self.track(event_code, event['voice_channel_id'], event['participants'])
+
+    def untrack(self, event_code):
+        self.channels = {channel_id: code for channel_id, code in self.channels.items() if code != event_code}
+        self._events.pop(event_code, None)
+        self._dirty.pop(event_code, None)
+
+    def clear(self):
+        self.channels.clear()
+        self._events.clear()
+        self._dirty.clear()
+
+    def open(self, event_code, user_id, now_ms):
+        """Opens a user's interval; returns True if the event has not seen them before."""
+        users = self._events[event_code]
+        entry = users.get(user_id)
+        self._dirty[event_code].add(user_id)
+        if entry is None:
+            users[user_id] = [0, now_ms]
+            return True
+        if entry[1] is None:
+            entry[1] = now_ms
+        return False
+
+    def close(self, event_code, user_id, now_ms):
+        entry = self._events[event_code].get(user_id)
+        if entry is not None and entry[1] is not None:
+            entry[0] += max(0, now_ms - entry[1])
+            entry[1] = None
+            self._dirty[event_code].add(user_id)
+
+    def drop(self, event_code, user_id):
+        """Forgets a user, e.g. after they were kicked; rejoining the channel starts a new stay."""
+        self._events[event_code].pop(user_id, None)
+        self._dirty[event_code].discard(user_id)
+
+    def total_ms(self, event_code, user_id, now_ms):
+        """Milliseconds the user has spent in the channel, counting their open interval up to `now_ms`."""
+        entry = self._events.get(event_code, {}).get(user_id)
+        if entry is None:
+            return 0
+        closed_ms, open_since = entry
+        return closed_ms + (max(0, now_ms - open_since) if open_since is not None else 0)
+
+    def reconcile(self, event_code, present, now_ms):
+        """Brings an event's open intervals in line with who is in its channel, e.g. after a reconnect.
+
+        Voice updates missed meanwhile are unknown, so a user who is gone is
+        credited up to the last checkpoint, where their open interval was
+        moved to. Returns the present users the event has not seen before.
+        """
+        users = self._events[event_code]
+        dirty = self._dirty[event_code]
+        for user_id, entry in users.items():
+            if entry[1] is not None and user_id not in present:
+                entry[1] = None
+                dirty.add(user_id)
+        new_users = []
+        for user_id in present:
+            if self.open(event_code, user_id, now_ms):
+                new_users.append(user_id)
+        return new_users
+
+    def checkpoint(self, now_ms):
+        """Returns {event code: {user ID: presence fields}} for every changed or connected participant.
+
+        Open intervals are folded into the closed total up to `now_ms` and
+        reopened there, so the persisted fields are complete as of the
+        checkpoint and a restart can tell how long everyone was known to stay.
+        """
+        changes = {}
+        for event_code, users in self._events.items():
+            dirty = self._dirty[event_code]
+            for user_id, entry in users.items():
+                if entry[1] is not None:
+                    entry[0] += max(0, now_ms - entry[1])
+                    entry[1] = now_ms
+                    dirty.add(user_id)
+            if dirty:
+                changes[event_code] = {
+                    user_id: {'voice_ms': users[user_id][0], 'voice_since': users[user_id][1]}
+                    for user_id in dirty if user_id in users
+                }
+                dirty.clear()
+        return changes
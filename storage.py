@@ -0,0 +1,1570 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+import functools
+import itertools
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from metrics import metrics, Timer
+from aggregates import summarize_records
+
+metrics.describe('sfl_store_flush_seconds', 'histogram', "Duration of each write-behind flush of buffered mutations.")
+metrics.describe('sfl_store_flush_bytes_total', 'counter', "Bytes appended to the journal by flushes.")
+metrics.describe('sfl_store_flush_ops_total', 'counter', "Mutations written by flushes.")
+metrics.describe('sfl_store_snapshot_seconds', 'histogram', "Duration of writing a JSON snapshot during compaction.")
+metrics.describe('sfl_store_snapshot_bytes_total', 'counter', "Bytes written to JSON snapshots.")
+metrics.describe('sfl_store_load_seconds', 'histogram', "Duration of loading persisted state at startup.")
+metrics.describe('sfl_store_seal_seconds', 'histogram', "Duration of sealing a month of records into a segment.")
+
+# --- Snapshot Helpers ---
+def write_json_atomic(file_path, data, indent=4):
+    """Writes JSON to a temporary file and swaps it into place, so readers never see a partial file."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def save_data(file_path, data, indent=4):
+    """Atomically saves data to a JSON file with error handling."""
+    try:
+        write_json_atomic(file_path, data, indent=indent)
+    except IOError as e:
+        logging.error(f"Could not write to file {file_path}: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while saving data to {file_path}: {e}")
+
+def write_records_json(file_path, records):
+    """Streams an iterable of records to a JSON array file without materialising it."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write('[')
+        for i, record in enumerate(records):
+            f.write(',\n    ' if i else '\n    ')
+            f.write(json.dumps(record.to_dict()))
+        f.write('\n]\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def load_data(file_path, default_data=None):
+    """Loads data from a JSON file, returning default data if not found or invalid."""
+    if default_data is None:
+        default_data = {}
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        save_data(file_path, default_data)
+        return default_data
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError) as e:
+        logging.warning(f"Could not load data from {file_path}, returning default. Reason: {e}")
+        return default_data
+
+# --- Record Representation ---
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_ms(value):
+    """Converts an ISO 8601 string, datetime or epoch-ms int to epoch milliseconds."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+def epoch_ms_to_iso(ms):
+    return (EPOCH + timedelta(milliseconds=ms)).isoformat()
+
+def epoch_ms_to_datetime(ms):
+    return EPOCH + timedelta(milliseconds=ms)
+
+def now_ms():
+    return time.time_ns() // 1_000_000
+
+def month_key(ms):
+    """Returns the UTC month of an epoch-millisecond time as 'YYYY-MM'."""
+    return epoch_ms_to_datetime(ms).strftime('%Y-%m')
+
+def month_start_ms(ms):
+    """Returns the first millisecond of the UTC month holding `ms`."""
+    moment = epoch_ms_to_datetime(ms)
+    return to_epoch_ms(datetime(moment.year, moment.month, 1, tzinfo=timezone.utc))
+
+def next_month_ms(ms):
+    """Returns the first millisecond of the UTC month after the one holding `ms`."""
+    moment = epoch_ms_to_datetime(ms)
+    year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+    return to_epoch_ms(datetime(year, month, 1, tzinfo=timezone.utc))
+
+class EventRecord:
+    """A finalized participation record.
+
+    Times are epoch milliseconds and the repeated ID and type strings are
+    interned, so a record costs a fraction of the equivalent dict. The ISO
+    dict form is only used at the JSON boundary, see `from_dict`/`to_dict`.
+    """
+
+    __slots__ = ('user_id', 'event_id', 'event_type', 'start_ms', 'end_ms', 'duration_minutes', 'points_earned')
+
+    def __init__(self, user_id, event_id, event_type, start_ms, end_ms, duration_minutes, points_earned):
+        self.user_id = sys.intern(str(user_id))
+        self.event_id = sys.intern(str(event_id))
+        self.event_type = sys.intern(event_type) if event_type is not None else None
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.duration_minutes = duration_minutes
+        self.points_earned = points_earned
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['user_id'],
+            data['event_id'],
+            data.get('event_type'),
+            to_epoch_ms(data['start_time']),
+            to_epoch_ms(data['end_time']),
+            data.get('duration_minutes', 0.0),
+            data.get('points_earned', 0.0),
+        )
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'start_time': epoch_ms_to_iso(self.start_ms),
+            'end_time': epoch_ms_to_iso(self.end_ms),
+            'duration_minutes': self.duration_minutes,
+            'points_earned': self.points_earned,
+        }
+
+    @property
+    def start_time(self):
+        return epoch_ms_to_datetime(self.start_ms)
+
+def encode_for_json(value):
+    """`json.dumps` fallback for the compact in-memory types."""
+    if isinstance(value, EventRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class CursorIndex:
+    """Record positions ordered by (start_ms, position), held in two parallel integer arrays.
+
+    A cursor is a (start_ms, position) pair, so paging is a bisect on the
+    start times followed by an integer comparison on positions.
+    """
+
+    def __init__(self):
+        self.starts = array('q')
+        self.positions = array('q')
+
+    def build(self, pairs):
+        """Replaces the contents with the given (start_ms, position) pairs."""
+        pairs = sorted(pairs)
+        self.starts = array('q', (start_ms for start_ms, _ in pairs))
+        self.positions = array('q', (position for _, position in pairs))
+
+    def add(self, start_ms, position):
+        # New positions are always the largest, so they go after equal start times.
+        i = bisect_right(self.starts, start_ms)
+        self.starts.insert(i, start_ms)
+        self.positions.insert(i, position)
+
+    def clear(self):
+        self.starts = array('q')
+        self.positions = array('q')
+
+    def _locate(self, cursor):
+        """Returns the number of entries ordered before `cursor`."""
+        start_ms, position = cursor
+        i = bisect_left(self.starts, start_ms)
+        while i < len(self.starts) and self.starts[i] == start_ms and self.positions[i] < position:
+            i += 1
+        return i
+
+    def page(self, before=None, after=None, limit=10):
+        """Returns up to `limit` cursors next to `before` or `after`, newest first."""
+        return [(self.starts[i], self.positions[i]) for i in self.page_indexes(before, after, limit)]
+
+    def page_indexes(self, before=None, after=None, limit=10):
+        """Like `page`, but returns the array indexes of the cursors."""
+        if before is not None:
+            end = self._locate(before)
+            indexes = range(max(0, end - limit), end)
+        elif after is not None:
+            start = self._locate(after)
+            if start < len(self.starts) and (self.starts[start], self.positions[start]) == tuple(after):
+                start += 1
+            indexes = range(start, min(len(self.starts), start + limit))
+        else:
+            indexes = range(max(0, len(self.starts) - limit), len(self.starts))
+        return list(reversed(indexes))
+
+    def __len__(self):
+        return len(self.starts)
+
+# --- Write-Ahead Journal ---
+class Journal:
+    """Append-only log of state mutations, stored as one JSON object per line.
+
+    Appends only buffer the encoded line; `flush` writes every buffered line
+    with a single write and fsync, so a burst of mutations costs one disk sync.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.compacting_path = f"{file_path}.compacting"
+        # A rotation writes here until the rotated journal is moved aside, see `rotate`.
+        self.next_path = f"{file_path}.next"
+        self.entries = 0
+        self._file = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def open(self):
+        self._file = open(self.file_path, 'ab')
+
+    def append(self, op):
+        """Buffers a single mutation until the next flush."""
+        line = encode_journal_line(op)
+        with self._pending_lock:
+            self._pending.append(line)
+        self.entries += 1
+
+    def flush(self):
+        """Writes all buffered mutations and forces them to disk."""
+        with self._write_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        # The file is taken with the lines, since `rotate` may swap both meanwhile.
+        with self._pending_lock:
+            if self._file is None or not self._pending:
+                return
+            lines, self._pending = self._pending, []
+            file = self._file
+        try:
+            self._write(file, lines)
+        except Exception:
+            # Keep the mutations so the next flush can retry them.
+            with self._pending_lock:
+                self._pending[:0] = lines
+            raise
+
+    def _write(self, file, lines):
+        if not lines:
+            return
+        data = ''.join(lines).encode()
+        started = time.perf_counter()
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+        metrics.observe('sfl_store_flush_seconds', time.perf_counter() - started, backend='json')
+        metrics.inc('sfl_store_flush_bytes_total', len(data), backend='json')
+        metrics.inc('sfl_store_flush_ops_total', len(lines), backend='json')
+
+    def rotate(self):
+        """Starts a fresh journal for the mutations that follow and returns the rotated one.
+
+        Only the buffer and the file handle are swapped, so this is cheap
+        enough for the event loop; pass the result to `finish_rotation` on
+        another thread to write it out. The fresh journal is opened at
+        `next_path` until then, and `read_all` reads it last.
+        """
+        file = open(self.next_path, 'ab')
+        with self._pending_lock:
+            rotated = (self._file, self._pending)
+            self._file, self._pending = file, []
+        self.entries = 0
+        return rotated
+
+    def finish_rotation(self, rotated):
+        """Writes out a journal returned by `rotate` and moves it aside for compaction.
+
+        If an earlier compaction failed and left its journal behind, the
+        rotated journal is appended to it so no mutation is dropped.
+        """
+        file, lines = rotated
+        # Waits for a flush that took lines before the swap and may still be writing them.
+        with self._write_lock:
+            self._write(file, lines)
+            file.close()
+            if os.path.exists(self.file_path):
+                if os.path.exists(self.compacting_path):
+                    with open(self.compacting_path, 'ab') as dst, open(self.file_path, 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.file_path)
+                else:
+                    os.replace(self.file_path, self.compacting_path)
+            # The open handle follows the file, so appends carry on under the regular name.
+            os.replace(self.next_path, self.file_path)
+
+    def read_all(self):
+        """Yields the mutations of every journal on disk, oldest first."""
+        for path in (self.compacting_path, self.file_path, self.next_path):
+            yield from Journal.read(path)
+
+    def consolidate(self, ops):
+        """Replaces the journals left by the previous run with one compacting journal holding `ops`.
+
+        This drops any torn tail, so mutations journaled after a restart are
+        never hidden behind a partial line. Call it before `open`.
+        """
+        if ops:
+            temp_path = f"{self.compacting_path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(''.join(encode_journal_line(op) for op in ops).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.compacting_path)
+        elif os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+        for path in (self.file_path, self.next_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        with self._write_lock:
+            if self._file:
+                self._flush_locked()
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def read(file_path):
+        """Yields the mutations stored in a journal file, stopping at a torn tail."""
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, 'r') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Ignoring truncated journal entry at {file_path}:{line_no}.")
+                    return
+
+def encode_journal_line(op):
+    return json.dumps(op, separators=(',', ':'), default=encode_for_json) + '\n'
+
+# --- Record Segments ---
+# How many segment indexes stay loaded for paging through archived records.
+SEGMENT_INDEX_CACHE_SIZE = 2
+
+class Segment:
+    """A sealed, immutable slice of the record history, stored as three files in `directory`.
+
+    `<name>.jsonl` holds the records sorted by start time, `<name>.index.json`
+    the start time, history position and byte offset of every line, and
+    `<name>.summary.json` the point totals the leaderboards are seeded from.
+    `<name>.users.jsonl` repeats the index per user, one line each, located
+    through `<name>.user_offsets.json`. Only the bounds and user offsets stay
+    in memory; the index or a user's line is read when a query reaches this
+    far back. A segment holds one month of records, whose history positions
+    need not be consecutive.
+    """
+
+    def __init__(self, directory, name, base, last_position, count, min_start_ms, max_start_ms):
+        self.directory = directory
+        self.name = name
+        # Lowest and highest history position of the segment's records.
+        self.base = base
+        self.last_position = last_position
+        self.count = count
+        self.min_start_ms = min_start_ms
+        self.max_start_ms = max_start_ms
+        self.users = frozenset()
+        # Byte offset of each user's line in `<name>.users.jsonl`; None for segments sealed without it.
+        self.user_offsets = None
+        self.summary = None
+
+    @classmethod
+    def from_manifest(cls, directory, entry):
+        # Segments sealed before they could skip positions do not list their last one.
+        last_position = entry.get('last_position', entry['base'] + entry['count'] - 1)
+        return cls(directory, entry['name'], entry['base'], last_position, entry['count'], entry['min_start_ms'], entry['max_start_ms'])
+
+    def to_manifest(self):
+        return {
+            'name': self.name, 'base': self.base, 'last_position': self.last_position, 'count': self.count,
+            'min_start_ms': self.min_start_ms, 'max_start_ms': self.max_start_ms,
+        }
+
+    def path(self, suffix):
+        return os.path.join(self.directory, f"{self.name}{suffix}")
+
+    # Every cursor in the segment lies between these two.
+    @property
+    def first_cursor(self):
+        return (self.min_start_ms, self.base)
+
+    @property
+    def last_cursor(self):
+        return (self.max_start_ms, self.last_position)
+
+    def load_summary(self):
+        """Reads the summary, keeping it for `take_summary`, and the user offsets."""
+        with open(self.path('.summary.json'), 'r') as f:
+            self.summary = json.load(f)
+        self.users = frozenset(self.summary['users'])
+        if os.path.exists(self.path('.user_offsets.json')):
+            with open(self.path('.user_offsets.json'), 'r') as f:
+                self.user_offsets = json.load(f)
+
+    def take_summary(self):
+        """Returns the summary, reading it again if it was already taken."""
+        if self.summary is None:
+            self.load_summary()
+        summary, self.summary = self.summary, None
+        return summary
+
+    def load_index(self):
+        with open(self.path('.index.json'), 'r') as f:
+            return SegmentIndex(json.load(f))
+
+    def page(self, index, user_id=None, before=None, after=None, limit=10):
+        """Returns up to `limit` (cursor, record) pairs of this segment, like `JournalStore.records_page`."""
+        if user_id is None:
+            order, lines = index.order, None
+        else:
+            order, lines = index.user_order(user_id)
+        indexes = order.page_indexes(before, after, limit)
+        records = self.read_lines(index.offsets, indexes if lines is None else [lines[i] for i in indexes])
+        return [((order.starts[i], order.positions[i]), record) for i, record in zip(indexes, records)]
+
+    def user_page(self, user_id, before=None, after=None, limit=10):
+        """Like `page` for one user's records, reading only that user's line of `<name>.users.jsonl`."""
+        with open(self.path('.users.jsonl'), 'rb') as f:
+            f.seek(self.user_offsets[user_id])
+            starts, positions, offsets = json.loads(f.readline())
+        order = CursorIndex()
+        order.starts = array('q', starts)
+        order.positions = array('q', positions)
+        indexes = order.page_indexes(before, after, limit)
+        records = self.read_lines(offsets, indexes)
+        return [((order.starts[i], order.positions[i]), record) for i, record in zip(indexes, records)]
+
+    def read_lines(self, offsets, lines):
+        records = []
+        with open(self.path('.jsonl'), 'rb') as f:
+            for line in lines:
+                f.seek(offsets[line])
+                records.append(EventRecord.from_dict(json.loads(f.readline())))
+        return records
+
+    def __iter__(self):
+        """Streams the records in start-time order."""
+        with open(self.path('.jsonl'), 'rb') as f:
+            for line in f:
+                yield EventRecord.from_dict(json.loads(line))
+
+class SegmentIndex:
+    """The loaded `<name>.index.json` of a segment; per-user cursor indexes are built on first use."""
+
+    def __init__(self, data):
+        self.order = CursorIndex()
+        self.order.starts = array('q', data['starts'])
+        self.order.positions = array('q', data['positions'])
+        self.offsets = array('q', data['offsets'])
+        # Only segments sealed before `<name>.users.jsonl` existed list each user's lines here.
+        self._user_lines = data.get('users', {})
+        self._user_orders = {}
+
+    def user_order(self, user_id):
+        """Returns (CursorIndex, line numbers) for one user's records."""
+        entry = self._user_orders.get(user_id)
+        if entry is None:
+            lines = self._user_lines.get(user_id, [])
+            order = CursorIndex()
+            order.starts = array('q', (self.order.starts[line] for line in lines))
+            order.positions = array('q', (self.order.positions[line] for line in lines))
+            entry = self._user_orders[user_id] = (order, lines)
+        return entry
+
+def write_segment(directory, name, records, record_positions):
+    """Writes `records`, whose history positions are the ascending `record_positions`, as a new segment and returns it."""
+    os.makedirs(directory, exist_ok=True)
+    segment = Segment(
+        directory, name, record_positions[0], record_positions[-1], len(records),
+        min(r.start_ms for r in records), max(r.start_ms for r in records),
+    )
+    order = sorted(range(len(records)), key=lambda i: (records[i].start_ms, i))
+    starts, positions, offsets, users = [], [], [], {}
+    offset = 0
+    tmp_path = f"{segment.path('.jsonl')}.tmp"
+    with open(tmp_path, 'wb') as f:
+        chunk = []
+        for line, i in enumerate(order):
+            record = records[i]
+            data = (json.dumps(record.to_dict(), separators=(',', ':')) + '\n').encode()
+            chunk.append(data)
+            starts.append(record.start_ms)
+            positions.append(record_positions[i])
+            offsets.append(offset)
+            offset += len(data)
+            users.setdefault(record.user_id, []).append(line)
+            if len(chunk) >= 1000:
+                f.write(b''.join(chunk))
+                chunk = []
+        f.write(b''.join(chunk))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, segment.path('.jsonl'))
+    write_json_atomic(segment.path('.index.json'), {'starts': starts, 'positions': positions, 'offsets': offsets}, indent=None)
+
+    user_offsets = {}
+    offset = 0
+    tmp_path = f"{segment.path('.users.jsonl')}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for user_id, lines in users.items():
+            data = (json.dumps([[starts[line] for line in lines], [positions[line] for line in lines], [offsets[line] for line in lines]], separators=(',', ':')) + '\n').encode()
+            f.write(data)
+            user_offsets[user_id] = offset
+            offset += len(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, segment.path('.users.jsonl'))
+    write_json_atomic(segment.path('.user_offsets.json'), user_offsets, indent=None)
+    write_json_atomic(segment.path('.summary.json'), summarize_records(records), indent=None)
+    segment.users = frozenset(users)
+    segment.user_offsets = user_offsets
+    return segment
+
+def page_reaches(segment, page, user_id, before, after, limit):
+    """Returns whether `segment` can hold a record of the page being assembled in `page`."""
+    if user_id is not None and user_id not in segment.users:
+        return False
+    if before is not None and tuple(before) <= segment.first_cursor:
+        return False
+    if after is not None and tuple(after) >= segment.last_cursor:
+        return False
+    if len(page) >= limit:
+        cursors = sorted(cursor for cursor, _ in page)
+        if after is None and cursors[-limit] > segment.last_cursor:
+            return False
+        if after is not None and cursors[limit - 1] < segment.first_cursor:
+            return False
+    return True
+
+def finish_page(page, after, limit):
+    """Orders the assembled (cursor, record) pairs newest first and keeps the `limit` next to the cursor."""
+    page.sort(key=lambda item: item[0], reverse=True)
+    return page[-limit:] if after is not None else page[:limit]
+
+# --- Active Events ---
+class ActiveEvents:
+    """In-memory map of event code to event, with creator and participant indexes.
+
+    All mutations go through the methods below so the indexes stay in sync;
+    reads use the usual mapping interface. Start and join times are held as
+    epoch milliseconds and converted to ISO strings only by `to_json`.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self._by_creator = {}
+        self._by_participant = {}
+
+    def load(self, events):
+        """Replaces the contents and rebuilds both indexes."""
+        self.clear()
+        for event_code, event in events.items():
+            self.start(event_code, event)
+
+    def start(self, event_code, event):
+        if event_code in self.events:
+            self.stop(event_code)
+        event['start_time'] = to_epoch_ms(event['start_time'])
+        for participant in event['participants'].values():
+            participant['join_time'] = to_epoch_ms(participant['join_time'])
+        self.events[event_code] = event
+        self._by_creator[event['creator_id']] = event_code
+        for user_id in event['participants']:
+            self._by_participant.setdefault(user_id, set()).add(event_code)
+
+    def join(self, event_code, user_id, participant):
+        event = self.events.get(event_code)
+        if event is None:
+            return
+        participant['join_time'] = to_epoch_ms(participant['join_time'])
+        event['participants'][user_id] = participant
+        self._by_participant.setdefault(user_id, set()).add(event_code)
+
+    def record_presence(self, event_code, presence):
+        """Stores checkpointed voice presence fields, {user ID: fields}, on the event's participants."""
+        event = self.events.get(event_code)
+        if event is None:
+            return
+        for user_id, fields in presence.items():
+            participant = event['participants'].get(user_id)
+            if participant is not None:
+                participant.update(fields)
+
+    def leave(self, event_code, user_id):
+        event = self.events.get(event_code)
+        if event is None:
+            return
+        event['participants'].pop(user_id, None)
+        self._unindex_participant(event_code, user_id)
+
+    def stop(self, event_code):
+        event = self.events.pop(event_code, None)
+        if event is None:
+            return
+        if self._by_creator.get(event['creator_id']) == event_code:
+            del self._by_creator[event['creator_id']]
+        for user_id in event['participants']:
+            self._unindex_participant(event_code, user_id)
+
+    def clear(self):
+        self.events.clear()
+        self._by_creator.clear()
+        self._by_participant.clear()
+
+    def _unindex_participant(self, event_code, user_id):
+        codes = self._by_participant.get(user_id)
+        if codes is not None:
+            codes.discard(event_code)
+            if not codes:
+                del self._by_participant[user_id]
+
+    def apply(self, op):
+        """Applies the active-event part of a store mutation. Replaying an op twice is harmless."""
+        kind = op.get('op')
+        if kind == 'start':
+            self.start(op['code'], op['event'])
+        elif kind == 'join':
+            self.join(op['code'], op['user_id'], op['participant'])
+        elif kind == 'presence':
+            self.record_presence(op['code'], op['participants'])
+        elif kind == 'leave':
+            self.leave(op['code'], op['user_id'])
+        elif kind == 'stop':
+            self.stop(op['code'])
+        elif kind == 'reset':
+            self.clear()
+        elif kind not in RECORD_OPS:
+            logging.warning(f"Ignoring unknown storage operation: {kind}")
+
+    def to_json(self):
+        """Returns a JSON-ready copy of the events with ISO timestamps."""
+        return {
+            event_code: {
+                **event,
+                'start_time': epoch_ms_to_iso(event['start_time']),
+                'participants': {
+                    user_id: {**participant, 'join_time': epoch_ms_to_iso(participant['join_time'])}
+                    for user_id, participant in event['participants'].items()
+                },
+            }
+            for event_code, event in self.events.items()
+        }
+
+    def by_creator(self, creator_id):
+        """Returns (event_code, event) for the event hosted by `creator_id`, or (None, None)."""
+        event_code = self._by_creator.get(str(creator_id))
+        if event_code is None:
+            return None, None
+        return event_code, self.events[event_code]
+
+    def codes_for_participant(self, user_id):
+        """Returns the codes of the events `user_id` is currently in."""
+        return frozenset(self._by_participant.get(str(user_id), ()))
+
+    def get(self, event_code, default=None):
+        return self.events.get(event_code, default)
+
+    def items(self):
+        return self.events.items()
+
+    def __getitem__(self, event_code):
+        return self.events[event_code]
+
+    def __contains__(self, event_code):
+        return event_code in self.events
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+# --- Store Base ---
+# Mutations that touch the record history; 'record' is the pre-batching form.
+RECORD_OPS = ('record', 'records', 'reset')
+
+class BaseStore:
+    """Common mutation API shared by the storage backends.
+
+    Active events always live in memory in `active_events`. Each
+    mutation is applied to memory immediately and handed to the backend,
+    which persists it from a write-behind thread every `flush_interval_ms`.
+
+    `load` only restores what active events need; the record history is
+    restored by `load_history`, which may run on another thread. Record
+    mutations block until `history_loaded` is set. `data_generation` is
+    bumped by every mutation except voice presence checkpoints, so callers
+    can tell whether anything they show changed; `record_generation` only
+    by those that add or clear records.
+
+    With `queries_block` set, `records_page` reads from disk and should be
+    run off the event loop; `begin_records_page` tells a caller on the loop
+    which pages can be served right away.
+    """
+
+    queries_block = False
+
+    def __init__(self, flush_interval_ms=250):
+        self.flush_interval = flush_interval_ms / 1000
+        self.data_generation = 0
+        self.record_generation = 0
+        self.active_events = ActiveEvents()
+        self.history_loaded = threading.Event()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name="store-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def _stop_flusher_thread(self):
+        self._stop_flusher.set()
+        if self._flusher and self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join()
+
+    # --- Mutations ---
+    def _mutate(self, op):
+        self._log(op)
+        self.data_generation += 1
+        if op['op'] in RECORD_OPS:
+            self.record_generation += 1
+
+    def start_event(self, event_code, event):
+        self._mutate({'op': 'start', 'code': event_code, 'event': event})
+
+    def join_event(self, event_code, user_id, participant):
+        self._mutate({'op': 'join', 'code': event_code, 'user_id': user_id, 'participant': participant})
+
+    def record_presence(self, event_code, presence):
+        # Checkpoints only persist voice intervals, which no response shows until the event is finalized.
+        self._log({'op': 'presence', 'code': event_code, 'participants': presence})
+
+    def leave_event(self, event_code, user_id):
+        self._mutate({'op': 'leave', 'code': event_code, 'user_id': user_id})
+
+    def end_event(self, event_code):
+        self._mutate({'op': 'stop', 'code': event_code})
+
+    def add_record(self, record):
+        self.add_records([record])
+
+    def add_records(self, records):
+        """Appends a batch of records as a single journaled mutation."""
+        self.history_loaded.wait()
+        self._mutate({'op': 'records', 'index': self.count_records(), 'records': records})
+
+    def reset(self):
+        self.history_loaded.wait()
+        self._mutate({'op': 'reset'})
+
+    # --- Queries ---
+    def begin_records_page(self, user_id=None, before=None, after=None, limit=10):
+        """Returns (page, None) for a `records_page` answered from memory, or (None, read) where `read()` returns the page and should run off the event loop."""
+        read = functools.partial(self.records_page, user_id, before=before, after=after, limit=limit)
+        if self.queries_block:
+            return None, read
+        return read(), None
+
+    # --- Points Index Sources ---
+    def hot_records(self):
+        """Returns the records to rebuild the points index from; `segment_summaries` covers the rest."""
+        return self.snapshot_records()
+
+    def segment_summaries(self):
+        """Returns the point totals of records archived out of memory, see `aggregates.summarize_records`."""
+        return []
+
+# --- Journaled JSON Store ---
+class JournalStore(BaseStore):
+    """Keeps recent event records in memory, persisted as JSON snapshots plus a journal.
+
+    Mutations are buffered in the journal and flushed by the write-behind
+    thread. Once the journal grows past `compact_threshold` entries it is
+    rotated and a snapshot of the state is written to the regular JSON files
+    by a background thread. The mutation that triggers this only swaps the
+    journal's buffer and file; the thread writes out the rotated journal and
+    rebuilds the active events snapshot by replaying it onto the last one.
+
+    The first compaction in a new UTC month seals the records of past months
+    held in memory into immutable segments under `segments/` (see `Segment`),
+    one per month, and keeps the current month's in the records snapshot.
+    `segments/manifest.json` lists the sealed segments, and queries read them
+    only when they reach back that far.
+    """
+
+    def __init__(self, active_events_file, event_records_file, journal_file, compact_threshold=1000, flush_interval_ms=250):
+        super().__init__(flush_interval_ms)
+        self.active_events_file = active_events_file
+        self.event_records_file = event_records_file
+        self.segments_dir = os.path.join(os.path.dirname(event_records_file), 'segments')
+        self.manifest_file = os.path.join(self.segments_dir, 'manifest.json')
+        self.journal = Journal(journal_file)
+        self.compact_threshold = compact_threshold
+        # Records after the sealed segments; position i here is history position archived_count + i.
+        self.event_records = []
+        self.segments = []
+        self.archived_count = 0
+        self._order = CursorIndex()
+        self._user_order = {}
+        self._segment_indexes = OrderedDict()
+        # Segment pages are read on worker threads, which share the index cache.
+        self._segment_indexes_lock = threading.Lock()
+        self._seal_after_ms = None
+        self._sealed = None
+        self._history_ops = []
+        self._generation = 0
+        self._compaction = None
+
+    def load(self):
+        """Loads the active events and replays the journaled mutations onto them.
+
+        Journaled record mutations are held back for `load_history`, and the
+        leftover journals are consolidated into one so nothing is replayed twice
+        against a newer snapshot.
+        """
+        with Timer('sfl_store_load_seconds', backend='json', phase='active'):
+            self.active_events.load(load_data(self.active_events_file, {}))
+            ops = list(self.journal.read_all())
+            for op in ops:
+                self.active_events.apply(op)
+            self._history_ops = [op for op in ops if op.get('op') in RECORD_OPS]
+            self.journal.consolidate(ops)
+        if ops:
+            logging.info(f"Replayed {len(ops)} journaled mutations on top of the snapshot.")
+        # Replayed entries count towards the next compaction, which folds them into the snapshot.
+        self.journal.entries = len(ops)
+        self.journal.open()
+        self._start_flusher()
+
+    def load_history(self):
+        """Loads the segment summaries and the record snapshot, replays the held-back record mutations and builds the indexes."""
+        with Timer('sfl_store_load_seconds', backend='json', phase='history'):
+            manifest = {}
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r') as f:
+                    manifest = json.load(f)
+            self.segments = [Segment.from_manifest(self.segments_dir, entry) for entry in manifest.get('segments', [])]
+            for segment in self.segments:
+                segment.load_summary()
+            self.archived_count = sum(segment.count for segment in self.segments)
+
+            records = load_data(self.event_records_file, [])
+            if manifest.get('sealing'):
+                # A seal was interrupted after the manifest listed the new segment;
+                # the records snapshot may still hold the records it archived.
+                records = records[manifest['sealing']:] if records else records
+                write_json_atomic(self.event_records_file, records, indent=None)
+                self._write_manifest(self.segments)
+            self._remove_orphan_segments(self.segments)
+            self.event_records.extend(EventRecord.from_dict(record) for record in records)
+            self._build_indexes()
+            # Records left from a past month, e.g. after upgrading, are sealed by the first compaction.
+            self._seal_after_ms = next_month_ms(self.event_records[0].start_ms if self.event_records else now_ms())
+
+            for op in self._history_ops:
+                self._apply_records(op)
+            self._history_ops = []
+        if self.segments:
+            logging.info(f"Loaded {len(self.segments)} sealed record segments ({self.archived_count} records) without reading their records.")
+        self.history_loaded.set()
+
+    def _build_indexes(self):
+        user_pairs = {}
+        for position, record in enumerate(self.event_records):
+            user_pairs.setdefault(record.user_id, []).append((record.start_ms, position))
+        self._order.build((record.start_ms, position) for position, record in enumerate(self.event_records))
+        self._user_order = {}
+        for user_id, pairs in user_pairs.items():
+            self._user_order[user_id] = CursorIndex()
+            self._user_order[user_id].build(pairs)
+
+    def flush(self):
+        """Forces every buffered mutation to disk."""
+        try:
+            self.journal.flush()
+        except Exception as e:
+            logging.error(f"Could not flush journal {self.journal.file_path}: {e}")
+
+    def _log(self, op):
+        if self._sealed is not None:
+            self._adopt_sealed()
+        self._apply(op)
+        self.journal.append(op)
+        # Compacting needs the records, so it waits until the history is loaded.
+        if self.history_loaded.is_set() and (self.journal.entries >= self.compact_threshold or self._seal_due()):
+            self.compact()
+
+    def _apply(self, op):
+        self._apply_records(op)
+        self.active_events.apply(op)
+
+    def _apply_records(self, op):
+        kind = op.get('op')
+        # Records already present in a partially written snapshot or a segment are skipped.
+        if kind == 'record':
+            # Single-record entries from journals written before records were batched.
+            if op['index'] >= self.count_records():
+                self._append_record(EventRecord.from_dict(op['record']))
+        elif kind == 'records':
+            for offset, record in enumerate(op['records']):
+                if op['index'] + offset >= self.count_records():
+                    if not isinstance(record, EventRecord):
+                        record = EventRecord.from_dict(record)
+                    self._append_record(record)
+        elif kind == 'reset':
+            # Bumped first so an export reading on another thread never sees the records half cleared.
+            self._generation += 1
+            # Segment files are removed by the next compaction, once the reset is in a snapshot.
+            self.event_records.clear()
+            self.segments = []
+            self.archived_count = 0
+            with self._segment_indexes_lock:
+                self._segment_indexes.clear()
+            self._order.clear()
+            self._user_order.clear()
+            self._seal_after_ms = next_month_ms(now_ms())
+
+    def _append_record(self, record):
+        position = len(self.event_records)
+        self.event_records.append(record)
+        self._order.add(record.start_ms, position)
+        self._user_order.setdefault(record.user_id, CursorIndex()).add(record.start_ms, position)
+
+    # --- Queries ---
+    def count_records(self):
+        return self.archived_count + len(self.event_records)
+
+    def records_page(self, user_id=None, before=None, after=None, limit=10):
+        """Returns up to `limit` (cursor, record) pairs, newest first by start time.
+
+        With `before` the page holds the records just older than that cursor,
+        with `after` the records just newer; otherwise the newest records.
+        Sealed segments are read only if they can hold a record of the page.
+        """
+        page, read = self.begin_records_page(user_id, before, after, limit)
+        return page if read is None else read()
+
+    def begin_records_page(self, user_id=None, before=None, after=None, limit=10):
+        """Pages the in-memory records and leaves the sealed segments the page reaches to `read`.
+
+        `read` only touches the segments picked here and their files, so it is
+        safe to run on another thread while the store keeps changing.
+        """
+        if self._sealed is not None:
+            self._adopt_sealed()
+        user_id = None if user_id is None else str(user_id)
+        base = self.archived_count
+        page = []
+        order = self._order if user_id is None else self._user_order.get(user_id)
+        if order is not None:
+            local_before = None if before is None else (before[0], before[1] - base)
+            local_after = None if after is None else (after[0], after[1] - base)
+            for start_ms, position in order.page(local_before, local_after, limit):
+                page.append(((start_ms, base + position), self.event_records[position]))
+
+        segments = [segment for segment in reversed(self.segments) if page_reaches(segment, page, user_id, before, after, limit)]
+        if not segments:
+            return finish_page(page, after, limit), None
+        return None, functools.partial(self._read_segment_pages, page, segments, user_id, before, after, limit)
+
+    def _read_segment_pages(self, page, segments, user_id, before, after, limit):
+        """Adds the records of `segments`, newest segment first, to `page` and returns the finished page."""
+        for segment in segments:
+            if not page_reaches(segment, page, user_id, before, after, limit):
+                continue
+            if user_id is not None and segment.user_offsets is not None:
+                page.extend(segment.user_page(user_id, before, after, limit))
+            else:
+                page.extend(segment.page(self._segment_index(segment), user_id, before, after, limit))
+        return finish_page(page, after, limit)
+
+    def _segment_index(self, segment):
+        with self._segment_indexes_lock:
+            index = self._segment_indexes.get(segment.name)
+            if index is not None:
+                self._segment_indexes.move_to_end(segment.name)
+                return index
+        index = segment.load_index()
+        with self._segment_indexes_lock:
+            self._segment_indexes[segment.name] = index
+            if len(self._segment_indexes) > SEGMENT_INDEX_CACHE_SIZE:
+                self._segment_indexes.popitem(last=False)
+        return index
+
+    def hot_records(self):
+        return list(self.event_records)
+
+    def segment_summaries(self):
+        return [segment.take_summary() for segment in self.segments]
+
+    def snapshot_records(self):
+        """Returns an iterable over all records that stays valid while the store keeps changing."""
+        return itertools.chain(*self.segments, list(self.event_records))
+
+    def iter_records(self, user_id=None, event_id=None, event_type=None, start_ms=None, end_ms=None):
+        """Yields the matching records, sealed segments first, without copying the record list.
+
+        `start_ms` and `end_ms` bound the start time, end exclusive; segments
+        outside that range are not read. Records added meanwhile may be
+        included; a reset or seal meanwhile raises RuntimeError instead of
+        mixing old and new records.
+        """
+        generation = self._generation
+        user_id = None if user_id is None else str(user_id)
+
+        def matches(record):
+            if user_id is not None and record.user_id != user_id:
+                return False
+            if event_id is not None and record.event_id != event_id:
+                return False
+            if event_type is not None and record.event_type != event_type:
+                return False
+            if start_ms is not None and record.start_ms < start_ms:
+                return False
+            return end_ms is None or record.start_ms < end_ms
+
+        for segment in list(self.segments):
+            if user_id is not None and user_id not in segment.users:
+                continue
+            if (start_ms is not None and segment.max_start_ms < start_ms) or (end_ms is not None and segment.min_start_ms >= end_ms):
+                continue
+            yield from filter(matches, segment)
+
+        records = self.event_records
+        for position in range(len(records)):
+            try:
+                record = records[position]
+            except IndexError:
+                record = None
+            # Checked after the read: a reset or seal bumps the generation before touching the records.
+            if self._generation != generation:
+                raise RuntimeError("Event records were reset or archived while they were being read.")
+            if matches(record):
+                yield record
+
+    # --- Compaction ---
+    def _seal_due(self):
+        return self._seal_after_ms is not None and now_ms() >= self._seal_after_ms
+
+    def compact(self, wait=False):
+        """Folds the journal into a fresh snapshot, in the background unless `wait` is set."""
+        self.history_loaded.wait()
+        if self._compaction and self._compaction.is_alive():
+            if not wait:
+                return
+            self._compaction.join()
+        if self._sealed is not None:
+            self._adopt_sealed()
+        # Everything that touches the disk, or every participant, runs on the compaction thread.
+        rotated = self.journal.rotate()
+        # Records are never mutated after being appended, so a shallow copy is enough.
+        records_snapshot = list(self.event_records)
+        seal = None
+        if self._seal_due():
+            # Sealing waits for the next month once it ran, even if records of past months are added meanwhile.
+            now = now_ms()
+            seal = (month_start_ms(now), self.archived_count, self._generation)
+            self._seal_after_ms = next_month_ms(now)
+        self._compaction = threading.Thread(
+            target=self._finish_compaction,
+            args=(rotated, records_snapshot, list(self.segments), seal),
+            name="journal-compaction",
+            daemon=True,
+        )
+        self._compaction.start()
+        if wait:
+            self._compaction.join()
+            if self._sealed is not None:
+                self._adopt_sealed()
+
+    def _finish_compaction(self, rotated, records_snapshot, segments, seal):
+        try:
+            self.journal.finish_rotation(rotated)
+            active_snapshot = self._active_snapshot()
+            if seal:
+                segments = self._seal(active_snapshot, records_snapshot, segments, seal)
+            else:
+                self._write_snapshot(active_snapshot, records_snapshot)
+                self._write_manifest(segments)
+            self._remove_orphan_segments(segments)
+            os.remove(self.journal.compacting_path)
+            logging.info(f"Compacted journal into snapshot ({len(records_snapshot)} records).")
+        except Exception as e:
+            logging.error(f"Journal compaction failed, will retry on next compaction: {e}")
+
+    def _active_snapshot(self):
+        """Rebuilds the active events as of the last rotation by replaying the compacting journal onto the last snapshot.
+
+        This leaves the live `active_events` to the event loop, which keeps changing them meanwhile.
+        """
+        active_events = ActiveEvents()
+        active_events.load(load_data(self.active_events_file, {}))
+        for op in Journal.read(self.journal.compacting_path):
+            active_events.apply(op)
+        return active_events.to_json()
+
+    def _seal(self, active_snapshot, records_snapshot, segments, seal):
+        """Archives the snapshot's records that started before `cutoff_ms` into one new segment per month.
+
+        Only the leading run of such records is archived, so the records kept
+        in memory still follow the segments in history order; a past month's
+        record added after the current month's ones waits for the next seal.
+        """
+        cutoff_ms, base, generation = seal
+        sealed_count = 0
+        while sealed_count < len(records_snapshot) and records_snapshot[sealed_count].start_ms < cutoff_ms:
+            sealed_count += 1
+        if not sealed_count:
+            self._write_snapshot(active_snapshot, records_snapshot)
+            self._write_manifest(segments)
+            return segments
+
+        months = {}
+        for offset in range(sealed_count):
+            months.setdefault(month_key(records_snapshot[offset].start_ms), []).append(offset)
+        sealed = []
+        with Timer('sfl_store_seal_seconds'):
+            for month, offsets in sorted(months.items()):
+                sealed.append(write_segment(
+                    self.segments_dir, f"records_{month}_{base + offsets[0]}",
+                    [records_snapshot[offset] for offset in offsets], [base + offset for offset in offsets],
+                ))
+        segments = segments + sealed
+        # `sealing` tells a restart to drop the archived records if the crash hit before the snapshot below.
+        self._write_manifest(segments, sealing=sealed_count)
+        self._write_snapshot(active_snapshot, records_snapshot[sealed_count:])
+        self._write_manifest(segments)
+        # The main thread swaps the segments in for the in-memory records, see `_adopt_sealed`.
+        self._sealed = (sealed, sealed_count, generation)
+        logging.info(f"Sealed {sealed_count} records into segments {', '.join(segment.name for segment in sealed)}.")
+        return segments
+
+    def _adopt_sealed(self):
+        """Replaces the in-memory records a finished seal archived with its segments."""
+        (sealed, sealed_count, generation), self._sealed = self._sealed, None
+        if generation != self._generation:
+            # Reset while sealing: the next compaction removes the segments' files.
+            return
+        # Bumped first so an export reading on another thread never sees shifted positions.
+        self._generation += 1
+        self.segments.extend(sealed)
+        self.archived_count += sealed_count
+        del self.event_records[:sealed_count]
+        self._build_indexes()
+
+    def _write_snapshot(self, active_snapshot, records_snapshot):
+        # Records are written first: replaying the journal over a newer records
+        # snapshot is safe because record ops carry their history position.
+        with Timer('sfl_store_snapshot_seconds'):
+            write_json_atomic(self.event_records_file, [record.to_dict() for record in records_snapshot], indent=None)
+            write_json_atomic(self.active_events_file, active_snapshot)
+        if metrics.enabled:
+            metrics.inc('sfl_store_snapshot_bytes_total', os.path.getsize(self.event_records_file) + os.path.getsize(self.active_events_file))
+
+    def _write_manifest(self, segments, sealing=0):
+        if not segments and not os.path.exists(self.manifest_file):
+            return
+        os.makedirs(self.segments_dir, exist_ok=True)
+        manifest = {'segments': [segment.to_manifest() for segment in segments]}
+        if sealing:
+            manifest['sealing'] = sealing
+        write_json_atomic(self.manifest_file, manifest)
+
+    def _remove_orphan_segments(self, segments):
+        """Deletes segment files the manifest no longer lists, e.g. after a reset or an interrupted seal."""
+        if not os.path.isdir(self.segments_dir):
+            return
+        keep = {segment.name for segment in segments} | {'manifest'}
+        for file_name in os.listdir(self.segments_dir):
+            if file_name.split('.', 1)[0] not in keep:
+                os.remove(os.path.join(self.segments_dir, file_name))
+
+    def close(self):
+        """Stops the flusher, writes any buffered mutations and closes the journal.
+
+        The mutations are written before waiting for a running compaction, so
+        a process killed during a long seal or snapshot still has them on disk.
+        """
+        self._stop_flusher_thread()
+        self.flush()
+        if self._compaction and self._compaction.is_alive():
+            self._compaction.join()
+        self.journal.close()
+
+# --- SQLite Store ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS active_events (
+    code TEXT PRIMARY KEY,
+    creator_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    event_type TEXT,
+    points_per_minute REAL,
+    voice_channel_id TEXT
+);
+CREATE TABLE IF NOT EXISTS participants (
+    code TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    join_time TEXT NOT NULL,
+    voice_ms INTEGER,
+    voice_since INTEGER,
+    PRIMARY KEY (code, user_id)
+);
+CREATE TABLE IF NOT EXISTS event_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    event_type TEXT,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    duration_minutes REAL NOT NULL,
+    points_earned REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_active_events_creator ON active_events (creator_id);
+CREATE INDEX IF NOT EXISTS idx_participants_user ON participants (user_id);
+CREATE INDEX IF NOT EXISTS idx_records_user_start ON event_records (user_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_records_start ON event_records (start_time);
+CREATE INDEX IF NOT EXISTS idx_records_event ON event_records (event_id);
+"""
+
+RECORD_COLUMNS = ('user_id', 'event_id', 'event_type', 'start_time', 'end_time', 'duration_minutes', 'points_earned')
+RECORD_SELECT = f"SELECT {', '.join(RECORD_COLUMNS)} FROM event_records"
+RECORD_SELECT_WITH_ID = f"SELECT id, {', '.join(RECORD_COLUMNS)} FROM event_records"
+RECORD_INSERT = f"INSERT INTO event_records ({', '.join(RECORD_COLUMNS)}) VALUES ({', '.join('?' * len(RECORD_COLUMNS))})"
+
+class SQLiteStore(BaseStore):
+    """Persists active events, participants and event records in an indexed SQLite database.
+
+    Only active events are kept in memory; record queries run against the
+    database so memory stays flat as the history grows. Mutations are queued
+    and written in one transaction per flush.
+    """
+
+    queries_block = True
+
+    def __init__(self, db_file, flush_interval_ms=250):
+        super().__init__(flush_interval_ms)
+        self.db_file = db_file
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._record_count = 0
+
+    def load(self):
+        """Opens the database and loads the active events into memory."""
+        with Timer('sfl_store_load_seconds', backend='sqlite', phase='active'):
+            self._load()
+        self._start_flusher()
+
+    def load_history(self):
+        """Counts the stored records; the records themselves are queried on demand."""
+        with Timer('sfl_store_load_seconds', backend='sqlite', phase='history'):
+            self._record_count = self._query("SELECT COUNT(*) FROM event_records")[0][0]
+        self.history_loaded.set()
+
+    def _load(self):
+        self._conn = connect_sqlite(self.db_file)
+        events = {}
+        rows = self._conn.execute("SELECT code, creator_id, event_id, start_time, event_type, points_per_minute, voice_channel_id FROM active_events")
+        for code, creator_id, event_id, start_time, event_type, points_per_minute, voice_channel_id in rows:
+            events[code] = {"creator_id": creator_id, "event_id": event_id, "start_time": to_epoch_ms(start_time), "participants": {}}
+            if points_per_minute is not None:
+                events[code].update(event_type=event_type, points_per_minute=points_per_minute)
+            if voice_channel_id is not None:
+                events[code]['voice_channel_id'] = voice_channel_id
+        for code, user_id, join_time, voice_ms, voice_since in self._conn.execute("SELECT code, user_id, join_time, voice_ms, voice_since FROM participants"):
+            if code in events:
+                events[code]['participants'][user_id] = {"join_time": to_epoch_ms(join_time)}
+                if voice_ms is not None:
+                    events[code]['participants'][user_id].update(voice_ms=voice_ms, voice_since=voice_since)
+        self.active_events.load(events)
+
+    def _log(self, op):
+        self.active_events.apply(op)
+        if op['op'] == 'start':
+            # The flusher thread must not iterate the live participants dict.
+            op = {**op, 'event': {**op['event'], 'participants': dict(op['event']['participants'])}}
+        elif op['op'] == 'records':
+            self._record_count += len(op['records'])
+        elif op['op'] == 'reset':
+            self._record_count = 0
+        with self._lock:
+            self._pending.append(op)
+
+    def flush(self):
+        """Writes every queued mutation in a single transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending or self._conn is None:
+            return
+        ops, self._pending = self._pending, []
+        started = time.perf_counter()
+        try:
+            with self._conn:
+                for op in ops:
+                    write_sqlite_op(self._conn, op)
+        except Exception as e:
+            # Keep the mutations so the next flush can retry them.
+            self._pending[:0] = ops
+            logging.error(f"Could not flush mutations to {self.db_file}: {e}")
+            return
+        metrics.observe('sfl_store_flush_seconds', time.perf_counter() - started, backend='sqlite')
+        metrics.inc('sfl_store_flush_ops_total', len(ops), backend='sqlite')
+
+    def _query(self, sql, params=()):
+        # Read-your-writes: queued mutations are committed before querying.
+        with self._lock:
+            self._flush_locked()
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- Queries ---
+    def count_records(self):
+        return self._record_count
+
+    def records_page(self, user_id=None, before=None, after=None, limit=10):
+        """Returns up to `limit` (cursor, record) pairs, newest first by start time.
+
+        With `before` the page holds the records just older than that cursor,
+        with `after` the records just newer; otherwise the newest records.
+        """
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(str(user_id))
+        if before is not None:
+            conditions.append("(start_time, id) < (?, ?)")
+            params.extend(before)
+        elif after is not None:
+            conditions.append("(start_time, id) > (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "ASC" if after is not None else "DESC"
+        rows = self._query(f"{RECORD_SELECT_WITH_ID} {where} ORDER BY start_time {direction}, id {direction} LIMIT ?", (*params, limit))
+        if after is not None:
+            rows.reverse()
+        return [((row[1 + RECORD_COLUMNS.index('start_time')], row[0]), record_from_row(row[1:])) for row in rows]
+
+    def snapshot_records(self):
+        """Returns an iterable over all records that stays valid while the store keeps changing."""
+        return self._iter_records()
+
+    def iter_records(self, user_id=None, event_id=None, event_type=None, start_ms=None, end_ms=None):
+        """Yields the matching records in the order they were added, filtering in SQL.
+
+        `start_ms` and `end_ms` bound the start time, end exclusive.
+        """
+        clauses = []
+        params = []
+        for clause, value in (
+            ("user_id = ?", None if user_id is None else str(user_id)),
+            ("event_id = ?", event_id),
+            ("event_type = ?", event_type),
+            ("start_time >= ?", None if start_ms is None else epoch_ms_to_iso(start_ms)),
+            ("start_time < ?", None if end_ms is None else epoch_ms_to_iso(end_ms)),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return self._iter_records(f" WHERE {' AND '.join(clauses)}" if clauses else "", params)
+
+    def _iter_records(self, where="", params=()):
+        # Queued mutations are committed once iteration starts, i.e. on the thread reading the records.
+        self.flush()
+        # Runs on its own connection so long exports never hold the store lock.
+        conn = connect_sqlite(self.db_file)
+        try:
+            for row in conn.execute(f"{RECORD_SELECT}{where} ORDER BY id", params):
+                yield record_from_row(row)
+        finally:
+            conn.close()
+
+    def compact(self, wait=False):
+        """SQLite maintains its own files, so there is nothing to compact."""
+
+    def close(self):
+        """Stops the flusher, writes any queued mutations and closes the database."""
+        self._stop_flusher_thread()
+        with self._lock:
+            if self._conn is not None:
+                self._flush_locked()
+                self._conn.close()
+                self._conn = None
+
+def record_from_row(row):
+    user_id, event_id, event_type, start_time, end_time, duration_minutes, points_earned = row
+    return EventRecord(user_id, event_id, event_type, to_epoch_ms(start_time), to_epoch_ms(end_time), duration_minutes, points_earned)
+
+def record_to_row(record):
+    return (
+        record.user_id,
+        record.event_id,
+        record.event_type,
+        epoch_ms_to_iso(record.start_ms),
+        epoch_ms_to_iso(record.end_ms),
+        record.duration_minutes,
+        record.points_earned,
+    )
+
+SQLITE_ADDED_COLUMNS = (
+    ('active_events', 'event_type', 'TEXT'),
+    ('active_events', 'points_per_minute', 'REAL'),
+    ('active_events', 'voice_channel_id', 'TEXT'),
+    ('participants', 'voice_ms', 'INTEGER'),
+    ('participants', 'voice_since', 'INTEGER'),
+)
+
+def connect_sqlite(db_file):
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SQLITE_SCHEMA)
+    # Databases created before these columns existed get them added.
+    for table, column, column_type in SQLITE_ADDED_COLUMNS:
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return conn
+
+PARTICIPANT_INSERT = "INSERT OR REPLACE INTO participants (code, user_id, join_time, voice_ms, voice_since) VALUES (?, ?, ?, ?, ?)"
+
+def participant_row(event_code, user_id, participant):
+    return (event_code, user_id, epoch_ms_to_iso(to_epoch_ms(participant['join_time'])), participant.get('voice_ms'), participant.get('voice_since'))
+
+def write_sqlite_op(conn, op):
+    """Writes a single storage mutation to the SQLite tables."""
+    kind = op.get('op')
+    if kind == 'start':
+        event = op['event']
+        conn.execute("INSERT OR REPLACE INTO active_events (code, creator_id, event_id, start_time, event_type, points_per_minute, voice_channel_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (op['code'], event['creator_id'], event['event_id'], epoch_ms_to_iso(to_epoch_ms(event['start_time'])),
+                      event.get('event_type'), event.get('points_per_minute'), event.get('voice_channel_id')))
+        conn.executemany(PARTICIPANT_INSERT, [participant_row(op['code'], user_id, p) for user_id, p in event['participants'].items()])
+    elif kind == 'join':
+        conn.execute(PARTICIPANT_INSERT, participant_row(op['code'], op['user_id'], op['participant']))
+    elif kind == 'presence':
+        conn.executemany("UPDATE participants SET voice_ms = ?, voice_since = ? WHERE code = ? AND user_id = ?",
+                         [(fields['voice_ms'], fields['voice_since'], op['code'], user_id) for user_id, fields in op['participants'].items()])
+    elif kind == 'leave':
+        conn.execute("DELETE FROM participants WHERE code = ? AND user_id = ?", (op['code'], op['user_id']))
+    elif kind == 'stop':
+        conn.execute("DELETE FROM participants WHERE code = ?", (op['code'],))
+        conn.execute("DELETE FROM active_events WHERE code = ?", (op['code'],))
+    elif kind == 'records':
+        conn.executemany(RECORD_INSERT, [record_to_row(record) for record in op['records']])
+    elif kind == 'reset':
+        conn.execute("DELETE FROM participants")
+        conn.execute("DELETE FROM active_events")
+        conn.execute("DELETE FROM event_records")
+
+STORAGE_BACKENDS = ('json', 'sqlite')
+
+def create_store(storage_config, data_dir, compact_threshold=1000, flush_interval_ms=250):
+    """Builds the store selected by the 'storage' section of config.json."""
+    backend = storage_config.get('backend', 'json')
+    if backend == 'json':
+        return JournalStore(
+            os.path.join(data_dir, 'active_events.json'),
+            os.path.join(data_dir, 'event_records.json'),
+            os.path.join(data_dir, 'journal.log'),
+            compact_threshold,
+            flush_interval_ms,
+        )
+    if backend == 'sqlite':
+        return SQLiteStore(os.path.join(data_dir, storage_config.get('sqlite_file', 'events.db')), flush_interval_ms)
+    raise ValueError(f"Unknown storage backend '{backend}'. Use 'json' or 'sqlite'.")
+
+# --- Per-Guild Layout ---
+def guild_data_dir(data_dir, guild_id, storage_config):
+    """Returns the directory holding one guild's data files.
+
+    Every guild gets `data_dir/guilds/<guild_id>`, except the guild named by
+    `storage.legacy_guild_id`, which keeps the files written to `data_dir`
+    itself before the bot supported several guilds.
+    """
+    if str(guild_id) == str(storage_config.get('legacy_guild_id')):
+        return data_dir
+    return os.path.join(data_dir, 'guilds', str(guild_id))
+
+def stored_guild_ids(data_dir, storage_config):
+    """Returns the IDs of the guilds that already have data in `data_dir`."""
+    guild_ids = []
+    if storage_config.get('legacy_guild_id'):
+        guild_ids.append(int(storage_config['legacy_guild_id']))
+    guilds_dir = os.path.join(data_dir, 'guilds')
+    if os.path.isdir(guilds_dir):
+        for entry in sorted(os.scandir(guilds_dir), key=lambda entry: entry.name):
+            if entry.is_dir() and entry.name.isdigit() and int(entry.name) not in guild_ids:
+                guild_ids.append(int(entry.name))
+    return guild_ids
+
+# --- JSON to SQLite Migration ---
+def migrate_json_to_sqlite(data_dir, db_file):
+    """Copies the JSON snapshots and journal in `data_dir` into a new SQLite database."""
+    source = JournalStore(
+        os.path.join(data_dir, 'active_events.json'),
+        os.path.join(data_dir, 'event_records.json'),
+        os.path.join(data_dir, 'journal.log'),
+    )
+    source.load()
+    source.load_history()
+    source.close()
+
+    conn = connect_sqlite(db_file)
+    try:
+        existing = conn.execute("SELECT (SELECT COUNT(*) FROM event_records) + (SELECT COUNT(*) FROM active_events)").fetchone()[0]
+        if existing:
+            raise RuntimeError(f"{db_file} already contains data; refusing to migrate into it.")
+        with conn:
+            for code, event in source.active_events.items():
+                write_sqlite_op(conn, {'op': 'start', 'code': code, 'event': event})
+            conn.executemany(RECORD_INSERT, (record_to_row(record) for record in source.snapshot_records()))
+    finally:
+        conn.close()
+    return len(source.active_events), source.count_records()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+    parser = argparse.ArgumentParser(description="Storage maintenance for the event bot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="One-shot migration of data/*.json into SQLite.")
+    migrate_parser.add_argument("--data-dir", default="data")
+    migrate_parser.add_argument("--db", default=os.path.join("data", "events.db"))
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        try:
+            events, records = migrate_json_to_sqlite(args.data_dir, args.db)
+        except RuntimeError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        logging.info(f"Migrated {events} active events and {records} records into {args.db}.")
@@ -0,0 +1,408 @@
+"""Crash-recovery and paging tests for the journaled JSON store.
+
+A crash is simulated by flushing the journal and abandoning the store
+without closing it, then loading a new store from the same files.
+
+    python3 -m pytest tests
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import storage  # noqa: E402
+from archive import import_records, write_records  # noqa: E402
+from aggregates import PointsIndex  # noqa: E402
+from storage import EventRecord, JournalStore, month_start_ms, next_month_ms, now_ms  # noqa: E402
+
+DAY_MS = 86_400_000
+
+def open_store(data_dir, compact_threshold=1000):
+    store = JournalStore(
+        os.path.join(data_dir, 'active_events.json'),
+        os.path.join(data_dir, 'event_records.json'),
+        os.path.join(data_dir, 'journal.log'),
+        compact_threshold=compact_threshold,
+        flush_interval_ms=10,
+    )
+    store.load()
+    store.load_history()
+    return store
+
+def crash(store):
+    """Leaves the store as a killed process would after its last flush."""
+    store.flush()
+    store._stop_flusher_thread()
+    if store._compaction is not None:
+        store._compaction.join()
+
+def make_record(user_id, start_ms, minutes=30):
+    return EventRecord(str(user_id), '101', 'Hangout', start_ms, start_ms + minutes * 60_000, float(minutes), float(minutes))
+
+def make_event(creator_id, start_ms):
+    return {'creator_id': str(creator_id), 'event_id': '101', 'start_time': start_ms, 'participants': {},
+            'event_type': 'Hangout', 'points_per_minute': 1}
+
+def history(store):
+    """Every record as (cursor, record dict), newest first, paged the way /event records pages."""
+    items, before = [], None
+    while True:
+        page = store.records_page(before=before, limit=7)
+        if not page:
+            return items
+        items.extend(as_dicts(page))
+        before = page[-1][0]
+
+def as_dicts(page):
+    return [(cursor, record.to_dict()) for cursor, record in page]
+
+def expected_history(records):
+    return sorted((((record.start_ms, position), record.to_dict()) for position, record in enumerate(records)), key=lambda item: item[0], reverse=True)
+
+def write_snapshot(data_dir, records):
+    with open(os.path.join(data_dir, 'event_records.json'), 'w') as f:
+        json.dump([record.to_dict() for record in records], f)
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path)
+
+# --- Journal Replay ---
+def test_replay_stops_at_torn_tail_and_keeps_later_mutations(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.join_event('AAAA', '2', {'join_time': started})
+    crash(store)
+    with open(os.path.join(data_dir, 'journal.log'), 'a') as f:
+        f.write('{"op":"join","code":"AAAA","user_id":"3","partic')
+
+    store = open_store(data_dir)
+    assert set(store.active_events['AAAA']['participants']) == {'2'}
+    # Journaled after the restart, so it must not hide behind the torn line.
+    store.join_event('AAAA', '4', {'join_time': started})
+    crash(store)
+
+    store = open_store(data_dir)
+    assert set(store.active_events['AAAA']['participants']) == {'2', '4'}
+    store.close()
+
+def test_restart_consolidates_compacting_and_live_journals(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.add_records([make_record(1, started - 60_000)])
+    crash(store)
+    # A compaction that died after rotating leaves the older mutations in the compacting journal.
+    journal = os.path.join(data_dir, 'journal.log')
+    os.replace(journal, f"{journal}.compacting")
+    store = open_store(data_dir)
+    store.join_event('AAAA', '2', {'join_time': started})
+    store.add_records([make_record(2, started)])
+    crash(store)
+
+    store = open_store(data_dir)
+    assert sorted(name for name in os.listdir(data_dir) if name.startswith('journal')) == ['journal.log', 'journal.log.compacting']
+    assert os.path.getsize(os.path.join(data_dir, 'journal.log')) == 0
+    assert set(store.active_events['AAAA']['participants']) == {'2'}
+    assert [record['user_id'] for _, record in history(store)] == ['2', '1']
+    store.close()
+
+def test_replay_reads_the_journal_of_an_unfinished_rotation(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.flush()
+    # Crash between swapping in the fresh journal and moving the rotated one aside.
+    rotated = store.journal.rotate()
+    store.join_event('AAAA', '2', {'join_time': started})
+    rotated[0].close()
+    crash(store)
+    assert os.path.exists(os.path.join(data_dir, 'journal.log.next'))
+
+    store = open_store(data_dir)
+    assert set(store.active_events['AAAA']['participants']) == {'2'}
+    assert not os.path.exists(os.path.join(data_dir, 'journal.log.next'))
+    store.close()
+
+def test_replay_after_partial_snapshot_does_not_duplicate_records(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    records = [make_record(user_id, started + user_id) for user_id in range(5)]
+    store.add_records(records[:3])
+    store.add_records(records[3:])
+    crash(store)
+    # The compaction wrote the records snapshot, then died before removing the journal.
+    write_snapshot(data_dir, records[:4])
+
+    store = open_store(data_dir)
+    assert store.count_records() == 5
+    assert history(store) == expected_history(records)
+    store.close()
+
+def test_close_writes_buffered_mutations_before_waiting_for_compaction(data_dir, monkeypatch):
+    store = open_store(data_dir)
+    store._stop_flusher_thread()
+    release = threading.Event()
+    original = store._write_snapshot
+
+    def slow_snapshot(*args):
+        release.wait(5)
+        original(*args)
+    monkeypatch.setattr(store, '_write_snapshot', slow_snapshot)
+    store.compact()
+    store.start_event('AAAA', make_event(1, now_ms()))
+    closing = threading.Thread(target=store.close)
+    closing.start()
+    try:
+        # A process killed while the snapshot is still being written keeps the mutation.
+        closing.join(0.5)
+        ops = list(storage.Journal.read(os.path.join(data_dir, 'journal.log')))
+        assert [op['op'] for op in ops] == ['start']
+    finally:
+        release.set()
+        closing.join()
+
+def test_compaction_snapshot_survives_restart(data_dir):
+    store = open_store(data_dir, compact_threshold=5)
+    started = now_ms()
+    records = []
+    for n in range(12):
+        store.start_event(f"E{n:03d}", make_event(n, started))
+        store.join_event(f"E{n:03d}", '99', {'join_time': started})
+        if n % 2:
+            store.end_event(f"E{n:03d}")
+            records.append(make_record(n, started + n))
+            store.add_records(records[-1:])
+    store.compact(wait=True)
+    active = store.active_events.to_json()
+    store.close()
+
+    store = open_store(data_dir)
+    assert store.active_events.to_json() == active
+    assert history(store) == expected_history(records)
+    store.close()
+
+# --- Active Events ---
+def test_participant_index_follows_mutations_and_replay(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.start_event('BBBB', make_event(2, started))
+    store.join_event('AAAA', '9', {'join_time': started})
+    store.join_event('BBBB', '9', {'join_time': started})
+    store.join_event('BBBB', '8', {'join_time': started})
+    store.leave_event('BBBB', '8')
+    assert store.active_events.codes_for_participant(9) == {'AAAA', 'BBBB'}
+    assert store.active_events.codes_for_participant('8') == frozenset()
+    store.end_event('AAAA')
+    crash(store)
+
+    store = open_store(data_dir)
+    assert store.active_events.codes_for_participant('9') == {'BBBB'}
+    store.reset()
+    assert store.active_events.codes_for_participant('9') == frozenset()
+    store.close()
+
+def test_record_generation_ignores_active_event_mutations(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.join_event('AAAA', '2', {'join_time': started})
+    assert store.record_generation == 0
+    store.add_records([make_record(2, started)])
+    assert store.record_generation == 1
+    store.close()
+
+def test_presence_checkpoints_are_journaled_without_bumping_data_generation(data_dir):
+    store = open_store(data_dir)
+    started = now_ms()
+    store.start_event('AAAA', make_event(1, started))
+    store.join_event('AAAA', '2', {'join_time': started, 'voice_ms': 0, 'voice_since': started})
+    generation = store.data_generation
+    store.record_presence('AAAA', {'2': {'voice_ms': 60_000, 'voice_since': None}})
+    assert store.data_generation == generation
+    crash(store)
+
+    store = open_store(data_dir)
+    assert store.active_events['AAAA']['participants']['2']['voice_ms'] == 60_000
+    store.close()
+
+# --- Sealed Segments ---
+def seed_past_months(data_dir):
+    """Writes a pre-upgrade records snapshot spanning the two previous months and the current one."""
+    current = month_start_ms(now_ms())
+    records = [make_record(n % 4, current - 50 * DAY_MS + n * DAY_MS) for n in range(50)]
+    records += [make_record(n % 4, current + n * 60_000) for n in range(3)]
+    write_snapshot(data_dir, records)
+    return records
+
+def test_seal_writes_one_segment_per_past_month(data_dir):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    current = month_start_ms(now_ms())
+    assert len(store.segments) == 2
+    assert all(record.start_ms >= current for record in store.event_records)
+    assert history(store) == expected_history(records)
+    store.close()
+
+def test_crash_mid_seal_drops_the_archived_records_from_the_snapshot(data_dir, monkeypatch):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+
+    def die(*args):
+        raise OSError("simulated crash")
+    # Segments and the `sealing` manifest are written, the records snapshot is not.
+    monkeypatch.setattr(store, '_write_snapshot', die)
+    store.compact(wait=True)
+    crash(store)
+    with open(os.path.join(data_dir, 'segments', 'manifest.json')) as f:
+        assert json.load(f)['sealing'] == 50
+
+    store = open_store(data_dir)
+    assert store.count_records() == len(records)
+    assert len(store.event_records) == 3
+    assert history(store) == expected_history(records)
+    store.close()
+
+def test_points_index_rebuilds_type_totals_from_segment_summaries(data_dir):
+    records = seed_past_months(data_dir)
+    records[0].event_type = 'Raid'
+    write_snapshot(data_dir, records)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    store.close()
+
+    store = open_store(data_dir)
+    index = PointsIndex()
+    index.rebuild(store.hot_records(), store.segment_summaries())
+    assert index.type_points == {'Raid': 30.0, 'Hangout': 30.0 * (len(records) - 1)}
+    store.close()
+
+def test_orphan_segment_files_are_removed_on_load(data_dir):
+    seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    store.close()
+    # A seal that died before its manifest was written leaves unlisted files behind.
+    orphan = os.path.join(data_dir, 'segments', 'records_2000-01_0.jsonl')
+    open(orphan, 'w').close()
+
+    store = open_store(data_dir)
+    assert not os.path.exists(orphan)
+    store.close()
+
+def test_paging_across_overlapping_segments(data_dir, monkeypatch):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    # Imported records of old months, interleaved with ones of the current month.
+    for n in range(30):
+        records.append(make_record(n % 5, month_start_ms(now_ms()) - (n % 3 + 1) * 20 * DAY_MS + n * 60_000))
+        records.append(make_record(n % 5, month_start_ms(now_ms()) + n * 1000))
+        store.add_records(records[-2:])
+    # The next month's seal archives the whole run, so segments overlap in time and positions.
+    later = next_month_ms(now_ms()) + DAY_MS
+    monkeypatch.setattr(storage, 'now_ms', lambda: later)
+    store._seal_after_ms = later
+    store.add_records([make_record(1, later)])
+    records.append(make_record(1, later))
+    store.compact(wait=True)
+    assert len(store.event_records) == 1
+
+    assert history(store) == expected_history(records)
+    for user_id in ('0', '3'):
+        page = store.records_page(user_id, limit=len(records))
+        assert [cursor for cursor, _ in page] == [cursor for cursor, record in expected_history(records) if record['user_id'] == user_id]
+    # Walking back up with `after` ends at the newest record.
+    oldest = history(store)[-1][0]
+    page = store.records_page(after=oldest, limit=len(records))
+    assert [cursor for cursor, _ in page] == [cursor for cursor, _ in expected_history(records)[:-1]]
+    store.close()
+
+def test_segment_pages_are_left_to_the_caller_and_user_pages_skip_the_index(data_dir, monkeypatch):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    # The newest page of everyone's records is all in memory.
+    page, read = store.begin_records_page(limit=3)
+    assert read is None and as_dicts(page) == expected_history(records)[:3]
+
+    def no_index(self):
+        raise AssertionError("a user's page must not load the whole segment index")
+    monkeypatch.setattr(storage.Segment, 'load_index', no_index)
+    page, read = store.begin_records_page('2', limit=len(records))
+    assert page is None
+    assert as_dicts(read()) == [(cursor, record) for cursor, record in expected_history(records) if record['user_id'] == '2']
+    store.close()
+
+def test_segments_without_user_lines_page_through_their_index(data_dir):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    store.close()
+    # Segments sealed before the per-user lines existed list each user's line numbers in the index.
+    segments_dir = os.path.join(data_dir, 'segments')
+    for file_name in os.listdir(segments_dir):
+        if file_name.endswith(('.users.jsonl', '.user_offsets.json')):
+            os.remove(os.path.join(segments_dir, file_name))
+        elif file_name.endswith('.index.json'):
+            name = file_name[:-len('.index.json')]
+            users = {}
+            with open(os.path.join(segments_dir, f"{name}.jsonl")) as f:
+                for line, data in enumerate(f):
+                    users.setdefault(json.loads(data)['user_id'], []).append(line)
+            with open(os.path.join(segments_dir, file_name)) as f:
+                index = json.load(f)
+            with open(os.path.join(segments_dir, file_name), 'w') as f:
+                json.dump({**index, 'users': users}, f)
+
+    store = open_store(data_dir)
+    page = store.records_page('1', limit=len(records))
+    assert as_dicts(page) == [(cursor, record) for cursor, record in expected_history(records) if record['user_id'] == '1']
+    store.close()
+
+# --- Reset ---
+def test_reset_then_restart_forgets_records_and_segments(data_dir):
+    seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    store.start_event('AAAA', make_event(1, now_ms()))
+    store.reset()
+    crash(store)
+
+    store = open_store(data_dir)
+    assert store.count_records() == 0
+    assert history(store) == []
+    assert len(store.active_events) == 0
+    assert store.segment_summaries() == []
+    store.compact(wait=True)
+    assert os.listdir(os.path.join(data_dir, 'segments')) == ['manifest.json']
+    store.add_records([make_record(1, now_ms())])
+    store.close()
+
+    store = open_store(data_dir)
+    assert [record['user_id'] for _, record in history(store)] == ['1']
+    store.close()
+
+# --- Import ---
+def test_importing_an_archive_twice_skips_the_records_already_in_the_history(data_dir):
+    records = seed_past_months(data_dir)
+    store = open_store(data_dir)
+    store.compact(wait=True)
+    archive_file = os.path.join(data_dir, 'export.jsonl')
+    write_records(store.iter_records(), archive_file, 'jsonl')
+    extra = make_record(7, now_ms())
+    with open(archive_file, 'a') as f:
+        f.write(json.dumps(extra.to_dict()) + '\n')
+
+    assert import_records(store, archive_file) == (1, len(records))
+    assert import_records(store, archive_file) == (0, len(records) + 1)
+    assert history(store) == expected_history(records + [extra])
+    store.close()